@@ -1,18 +1,188 @@
 
-from decimal import Decimal, getcontext
-from difflib import SequenceMatcher
+import logging
+from array import array
+from collections import OrderedDict
 from os.path import getsize
+from struct import calcsize, pack, unpack
 from timeit import default_timer as timer
 
-# Setting the precision to store the encoded number
-getcontext().prec=128
+from Instrumentation import phase, report
+from Stream_IO import StreamChecksum, first_mismatch, map_blocks, write_blocks
+
+logger = logging.getLogger(__name__)
+
+# The range coder works on a 32 bit interval and renormalizes a byte at a time
+# whenever the width of the interval falls below 2^24
+RANGE_MASK = 0xFFFFFFFF
+TOP_VALUE = 1 << 24
+# Frequencies are scaled so that their total fits in 16 bits, leaving at least 8 bits of precision per symbol
+MAX_TOTAL_FREQUENCY = 1 << 16
+# Number of encoded bytes or decoded symbols accumulated before they are handed out when streaming
+CHUNK_SIZE = 1 << 16
+# Frequency added to a symbol every time an adaptive model sees it
+ADAPTIVE_INCREMENT = 32
+# Adaptive models code every byte value plus this end of stream marker
+END_OF_STREAM = 256
+# Default order of the context model and bound on the number of contexts it keeps
+CONTEXT_ORDER = 3
+MAX_CONTEXTS = 1 << 16
+# The counts of a context are halved once one of them reaches this value, which keeps
+# the total of a context with its escape frequency within MAX_TOTAL_FREQUENCY
+MAX_CONTEXT_COUNT = 255
+
+# Files encoded with the static model start with the message length and the number of symbols,
+# followed by every symbol with its (scaled) frequency
+FILE_HEADER_FORMAT = '>QH'
+FILE_HEADER_SIZE = calcsize(FILE_HEADER_FORMAT)
+FILE_SYMBOL_FORMAT = '>BI'
+FILE_SYMBOL_SIZE = calcsize(FILE_SYMBOL_FORMAT)
+# Files encoded with an adaptive model start with the context order, 0 standing for the order-0 model
+ADAPTIVE_HEADER_FORMAT = '>B'
+
+class RangeEncoder:
+    '''
+    Integer range encoder with carry propagation
+    '''
+    def __init__(self):
+        self.low = 0
+        self.range = RANGE_MASK
+        # the last byte not yet written and the number of 0xFF bytes after it, both waiting for a possible carry
+        self.cache = 0
+        self.cache_size = 1
+        self.output = bytearray()
+
+    def encode(self, cumulative_frequency, frequency, total_frequency):
+        '''
+        Narrows the interval to the sub interval of a symbol
+
+        Parameters:
+            cumulative_frequency: total frequency of the symbols before the encoded symbol
+            frequency: frequency of the encoded symbol
+            total_frequency: total frequency of all the symbols
+        '''
+        r = self.range // total_frequency
+        self.low += r * cumulative_frequency
+        self.range = r * frequency
+        while self.range < TOP_VALUE:
+            self.range <<= 8
+            self.shift_low()
+
+    def shift_low(self):
+        '''
+        Moves the top byte of the interval out to the output, propagating the carry into the pending bytes
+        '''
+        if (self.low & RANGE_MASK) < 0xFF000000 or self.low > RANGE_MASK:
+            carry = self.low >> 32
+            byte = self.cache
+            while self.cache_size:
+                self.output.append((byte + carry) & 0xFF)
+                byte = 0xFF
+                self.cache_size -= 1
+            self.cache = (self.low >> 24) & 0xFF
+        self.cache_size += 1
+        self.low = (self.low << 8) & RANGE_MASK
+
+    def finish(self):
+        '''
+        Flushes the remaining bytes of the interval. The value of the interval ending with the most zero bytes is
+        written without them, as the decoder reads zeros past the end of its input
+
+        Return:
+            Encoded bytes
+        '''
+        for kept_bytes in range(5):
+            unit = 1 << (32 - 8 * kept_bytes)
+            value = (self.low + unit - 1) & ~(unit - 1)
+            if value < self.low + self.range:
+                break
+        self.low = value
+        # the pending byte goes out first, then the kept bytes of the value
+        for _ in range(kept_bytes + 1):
+            self.shift_low()
+        return self.take_output()
+
+    def take_output(self):
+        '''
+        Hands out the bytes written so far and clears the output buffer
+
+        Return:
+            Encoded bytes
+        '''
+        output = bytes(self.output)
+        self.output = bytearray()
+        return output
+
+class RangeDecoder:
+    '''
+    Integer range decoder matching RangeEncoder
+    '''
+    def __init__(self, encoded_msg, encoded_chunks=()):
+        '''
+        Parameters:
+            encoded_msg: The encoded bytes
+            encoded_chunks: An iterable of further encoded bytes, read once encoded_msg is used up
+        '''
+        self.encoded_msg = encoded_msg
+        self.encoded_chunks = iter(encoded_chunks)
+        self.position = 0
+        self.range = RANGE_MASK
+        self.code = 0
+        for _ in range(5):
+            self.code = (self.code << 8) | self.next_byte()
+        self.r = 1
+
+    def next_byte(self):
+        '''
+        Reads the next encoded byte, past the end of the encoded message the input is padded with zeros
+        '''
+        while self.position >= len(self.encoded_msg):
+            self.encoded_msg = next(self.encoded_chunks, None)
+            self.position = 0
+            if self.encoded_msg is None:
+                self.encoded_msg = b''
+                return 0
+        byte = self.encoded_msg[self.position]
+        self.position += 1
+        return byte
+
+    def get_frequency(self, total_frequency):
+        '''
+        Finds where the encoded value falls in the current interval
+
+        Parameters:
+            total_frequency: total frequency of all the symbols
+
+        Return:
+            A cumulative frequency inside the interval of the next symbol
+        '''
+        self.r = self.range // total_frequency
+        return min(self.code // self.r, total_frequency - 1)
+
+    def decode(self, cumulative_frequency, frequency):
+        '''
+        Narrows the interval to the sub interval of the decoded symbol
+
+        Parameters:
+            cumulative_frequency: total frequency of the symbols before the decoded symbol
+            frequency: frequency of the decoded symbol
+        '''
+        self.code -= self.r * cumulative_frequency
+        self.range = self.r * frequency
+        while self.range < TOP_VALUE:
+            self.code = ((self.code << 8) | self.next_byte()) & RANGE_MASK
+            self.range <<= 8
 
 class ArithmeticEncoding:
     '''
     Arithmeric Encoding class
     '''
-    def __init__(self, frequency_table):
+    def __init__(self, frequency_table, trace=False):
+        # keep the interval of every stage in self.stages, for debugging only
+        self.trace = trace
+        self.stages = []
         self.probability_table = self.get_probability_table(frequency_table)
+        self.frequency_table = self.get_scaled_frequency_table(frequency_table)
+        self.build_cumulative_table()
 
     def get_probability_table(self, frequency_table):
         '''
@@ -32,180 +202,650 @@ class ArithmeticEncoding:
 
         return probability_table
 
-    def get_encoded_value(self, encoder):
+    def get_scaled_frequency_table(self, frequency_table):
         '''
-        Calculates the final encoded value for the message at the last stage
+        Scales the frequencies down so that their total fits the precision of the range coder
 
         Parameters:
-            encoder: the list of probabilities at the last stage of encoding
-        
+            frequency_table : A dictionary where the keys are symbols and the frequency of the symbol is the value.
+
         Return:
-            Final encoded value
+            Frequency table with a total of at most MAX_TOTAL_FREQUENCY, every symbol keeping a frequency of at least 1
         '''
-        last_stage = list(encoder[-1].values())
-        last_stage_values = []
-        for sublist in last_stage:
-            for element in sublist:
-                last_stage_values.append(element)
-
-        last_stage_min = min(last_stage_values)
-        last_stage_max = max(last_stage_values)
+        total_frequency = sum(frequency_table.values())
+        if total_frequency <= MAX_TOTAL_FREQUENCY:
+            return dict(frequency_table)
 
-        return (last_stage_min + last_stage_max)/2
+        budget = MAX_TOTAL_FREQUENCY - len(frequency_table)
+        return {key: max(1, value * budget // total_frequency) for key, value in frequency_table.items()}
 
-    def process_stage(self, probability_table, stage_min, stage_max):
+    def build_cumulative_table(self):
+        '''
+        Precomputes the cumulative frequencies used at every stage of encoding and decoding.
+        symbol_ranges maps each symbol to its (cumulative frequency, frequency) for encoding,
+        and symbol_lookup maps every cumulative frequency to the index of its symbol for decoding
         '''
-        process a stage in the encoding/decoding process
+        self.symbols = list(self.frequency_table.keys())
+        self.cumulative_frequencies = [0]
+        self.symbol_ranges = {}
+        self.symbol_lookup = array('H')
+        for index, symbol in enumerate(self.symbols):
+            frequency = self.frequency_table[symbol]
+            self.symbol_ranges[symbol] = (self.cumulative_frequencies[-1], frequency)
+            self.symbol_lookup.extend(array('H', [index]) * frequency)
+            self.cumulative_frequencies.append(self.cumulative_frequencies[-1] + frequency)
+        self.total_frequency = self.cumulative_frequencies[-1]
+        # messages of byte values are decoded back to bytes rather than text
+        self.byte_symbols = all(isinstance(symbol, int) for symbol in self.symbols)
+
+    def encode(self, msg):
+        '''
+        Encodes the message using the frequency table
 
         Parameters:
-            probability_table: A dictionary with the probability of each symbol 
-            stage_min: minimum probability of the stage
-            stage_max: maximum probability of the stage
+            msg: The message to be encoded
         
         Return:
-            the probabilities in the stage
+            Encoded message
         '''
-        stage_probs = {}
-        stage_domain = stage_max - stage_min
-        for term_idx in range(len(probability_table.items())):
-            term = list(probability_table.keys())[term_idx]
-            term_prob = Decimal(probability_table[term])
-            cum_prob = term_prob * stage_domain + stage_min
-            stage_probs[term] = [stage_min, cum_prob]
-            stage_min = cum_prob
-        return stage_probs
+        return b''.join(self.encode_stream([msg]))
 
-    def encode(self, msg, probability_table):
+    def encode_stream(self, msg_chunks):
         '''
-        Encodes the message using the provided probability table
+        Encodes a message given in consecutive chunks, keeping only the current interval
 
         Parameters:
-            msg: The message to be encoded
-            probability_table: A dictionary with the probability of each symbol 
+            msg_chunks: An iterable of the parts of the message to be encoded
+
+        Return:
+            A generator of the encoded bytes, produced as soon as CHUNK_SIZE of them are ready
+        '''
+        self.stages = []
+        encoder = RangeEncoder()
+        symbol_ranges = self.symbol_ranges
+        total_frequency = self.total_frequency
+        for msg_chunk in msg_chunks:
+            for msg_term in msg_chunk:
+                cumulative_frequency, frequency = symbol_ranges[msg_term]
+                encoder.encode(cumulative_frequency, frequency, total_frequency)
+                if self.trace:
+                    self.stages.append((encoder.low, encoder.range))
+
+            if len(encoder.output) >= CHUNK_SIZE:
+                yield encoder.take_output()
+
+        yield encoder.finish()
+
+    def decode(self, encoded_msg, msg_length):
+        """
+        Decodes a message from the encoded bytes.
+        
+        Parameters:
+            encoded_msg: The encoded message.
+            msg_length: Length of the original message.
         
         Return:
-            Encoded message
+            The interval at every stage (only when tracing) and the decoded message.
+        """
+        decoded_msg = (b'' if self.byte_symbols else '').join(self.decode_stream([encoded_msg], msg_length))
+        return self.stages, decoded_msg
+
+    def decode_stream(self, encoded_chunks, msg_length):
+        """
+        Decodes a message given in consecutive chunks of encoded bytes, keeping only the current interval
+
+        Parameters:
+            encoded_chunks: An iterable of the encoded bytes
+            msg_length: Length of the original message.
+
+        Return:
+            A generator of the decoded message, in parts of CHUNK_SIZE symbols
+        """
+        self.stages = []
+        range_decoder = RangeDecoder(b'', encoded_chunks)
+        symbols = self.symbols
+        cumulative_frequencies = self.cumulative_frequencies
+        symbol_lookup = self.symbol_lookup
+        total_frequency = self.total_frequency
+        while msg_length > 0:
+            decoded_msg = []
+            for _ in range(min(msg_length, CHUNK_SIZE)):
+                # the symbol is found directly from the cumulative frequency, whatever the alphabet size
+                index = symbol_lookup[range_decoder.get_frequency(total_frequency)]
+                cumulative_frequency = cumulative_frequencies[index]
+
+                decoded_msg.append(symbols[index])
+                range_decoder.decode(cumulative_frequency, cumulative_frequencies[index + 1] - cumulative_frequency)
+                if self.trace:
+                    self.stages.append((range_decoder.code, range_decoder.range))
+
+            msg_length -= len(decoded_msg)
+            yield bytes(decoded_msg) if self.byte_symbols else ''.join(decoded_msg)
+
+class FenwickFrequencyModel:
+    '''
+    Adaptive frequency model of the symbols 0 to alphabet_size - 1, backed by a Fenwick (binary indexed) tree
+    so that cumulative frequencies, symbol search and updates all cost O(log alphabet_size)
+    '''
+    def __init__(self, alphabet_size, increment=ADAPTIVE_INCREMENT, max_total_frequency=MAX_TOTAL_FREQUENCY):
+        self.alphabet_size = alphabet_size
+        self.increment = increment
+        self.max_total_frequency = max_total_frequency
+        # every symbol starts with a frequency of 1 so that it can always be coded
+        self.frequencies = [1] * alphabet_size
+        self.build_tree()
+
+    def build_tree(self):
+        '''
+        Builds the Fenwick tree from the frequencies in linear time
+        '''
+        self.tree = [0] + self.frequencies
+        for index in range(1, self.alphabet_size + 1):
+            parent = index + (index & -index)
+            if parent <= self.alphabet_size:
+                self.tree[parent] += self.tree[index]
+        self.total_frequency = sum(self.frequencies)
+        self.top_step = 1 << (self.alphabet_size.bit_length() - 1)
+
+    def get_cumulative_frequency(self, symbol):
         '''
-        encoder = []
+        Parameters:
+            symbol: a symbol of the alphabet
 
-        stage_min = Decimal(0.0)
-        stage_max = Decimal(1.0)
-        
-        for msg_term_idx in range(len(msg)):
-            stage_probs = self.process_stage(probability_table, stage_min, stage_max)
+        Return:
+            Total frequency of the symbols before symbol
+        '''
+        cumulative_frequency = 0
+        tree = self.tree
+        while symbol > 0:
+            cumulative_frequency += tree[symbol]
+            symbol -= symbol & -symbol
+        return cumulative_frequency
+
+    def find(self, target):
+        '''
+        Finds the symbol whose interval contains a cumulative frequency
+
+        Parameters:
+            target: a cumulative frequency below the total frequency
+
+        Return:
+            The symbol and its cumulative frequency
+        '''
+        symbol = 0
+        cumulative_frequency = 0
+        tree = self.tree
+        step = self.top_step
+        while step:
+            index = symbol + step
+            if index <= self.alphabet_size and cumulative_frequency + tree[index] <= target:
+                symbol = index
+                cumulative_frequency += tree[index]
+            step >>= 1
+        return symbol, cumulative_frequency
+
+    def update(self, symbol):
+        '''
+        Counts one more occurrence of symbol, halving all the frequencies when the total gets too large
+        '''
+        increment = self.increment
+        self.frequencies[symbol] += increment
+        self.total_frequency += increment
+        if self.total_frequency > self.max_total_frequency:
+            self.frequencies = [(frequency + 1) // 2 for frequency in self.frequencies]
+            self.build_tree()
+            return
+
+        tree = self.tree
+        index = symbol + 1
+        while index <= self.alphabet_size:
+            tree[index] += increment
+            index += index & -index
+
+class AdaptiveArithmeticEncoding:
+    '''
+    Single pass arithmetic encoding of bytes, the frequencies are learnt while coding
+    so they neither need to be known up front nor stored with the encoded message
+    '''
+    def __init__(self, increment=ADAPTIVE_INCREMENT):
+        self.increment = increment
+
+    def encode(self, msg):
+        '''
+        Encodes the message
+
+        Parameters:
+            msg: The bytes to be encoded
 
-            msg_term = msg[msg_term_idx]
-            stage_min = stage_probs[msg_term][0]
-            stage_max = stage_probs[msg_term][1]
+        Return:
+            Encoded message
+        '''
+        return b''.join(self.encode_stream([msg]))
 
-            encoder.append(stage_probs)
+    def encode_stream(self, msg_chunks):
+        '''
+        Encodes a message given in consecutive chunks, ending it with the end of stream marker
 
-        stage_probs = self.process_stage(probability_table, stage_min, stage_max)
-        encoder.append(stage_probs)
+        Parameters:
+            msg_chunks: An iterable of the parts of the message to be encoded, as bytes
 
-        encoded_msg = self.get_encoded_value(encoder)
+        Return:
+            A generator of the encoded bytes, produced as soon as CHUNK_SIZE of them are ready
+        '''
+        model = FenwickFrequencyModel(END_OF_STREAM + 1, self.increment)
+        encoder = RangeEncoder()
+        for msg_chunk in msg_chunks:
+            for msg_term in msg_chunk:
+                encoder.encode(model.get_cumulative_frequency(msg_term), model.frequencies[msg_term], model.total_frequency)
+                model.update(msg_term)
+
+            if len(encoder.output) >= CHUNK_SIZE:
+                yield encoder.take_output()
 
-        return encoded_msg
+        encoder.encode(model.get_cumulative_frequency(END_OF_STREAM), model.frequencies[END_OF_STREAM], model.total_frequency)
+        yield encoder.finish()
 
-    def decode(self, encoded_msg, msg_length, probability_table):
+    def decode(self, encoded_msg):
         """
-        Decodes a message from the floating-point number.
-        
+        Decodes a message from the encoded bytes.
+
         Parameters:
             encoded_msg: The encoded message.
-            msg_length: Length of the original message.
-            probability_table: A dictionary with the probability of each symbol 
-        
+
         Return:
             Decoded message.
         """
-        decoder = []
-        decoded_msg = ""
+        return b''.join(self.decode_stream([encoded_msg]))
+
+    def decode_stream(self, encoded_chunks):
+        """
+        Decodes a message given in consecutive chunks of encoded bytes, up to the end of stream marker
+
+        Parameters:
+            encoded_chunks: An iterable of the encoded bytes
+
+        Return:
+            A generator of the decoded bytes, in parts of CHUNK_SIZE bytes
+        """
+        model = FenwickFrequencyModel(END_OF_STREAM + 1, self.increment)
+        range_decoder = RangeDecoder(b'', encoded_chunks)
+        decoded_msg = bytearray()
+        while True:
+            msg_term, cumulative_frequency = model.find(range_decoder.get_frequency(model.total_frequency))
+            range_decoder.decode(cumulative_frequency, model.frequencies[msg_term])
+            if msg_term == END_OF_STREAM:
+                break
+            model.update(msg_term)
+
+            decoded_msg.append(msg_term)
+            if len(decoded_msg) >= CHUNK_SIZE:
+                yield bytes(decoded_msg)
+                decoded_msg = bytearray()
+
+        yield bytes(decoded_msg)
+
+class ContextModel:
+    '''
+    Order-k context model with PPM escapes (method C) and symbol exclusion.
+    A symbol is coded in the longest context that has seen it, escaping to shorter contexts otherwise,
+    and at last with a uniform distribution over all the byte values and the end of stream marker.
+    At most max_contexts contexts are kept, the least recently used one is evicted to make room for a new one
+    '''
+    def __init__(self, order=CONTEXT_ORDER, max_contexts=MAX_CONTEXTS):
+        self.order = order
+        self.max_contexts = max_contexts
+        # maps the context (the previous bytes) to a dictionary of the counts of the symbols that followed it
+        self.contexts = OrderedDict()
 
-        stage_min = Decimal(0.0)
-        stage_max = Decimal(1.0)
+    def get_context(self, context):
+        '''
+        Looks up the counts of a context, marking it as recently used
+        '''
+        table = self.contexts.get(context)
+        if table is not None:
+            self.contexts.move_to_end(context)
+        return table
 
-        for _ in range(msg_length):
-            stage_probs = self.process_stage(probability_table, stage_min, stage_max)
+    def encode(self, encoder, history, msg_term):
+        '''
+        Encodes a symbol
 
-            for msg_term, value in stage_probs.items():
-                if encoded_msg >= value[0] and encoded_msg <= value[1]:
-                    break
+        Parameters:
+            encoder: the RangeEncoder
+            history: the previous bytes of the message, at most order of them
+            msg_term: the symbol to be encoded
+        '''
+        excluded = set()
+        for order in range(min(self.order, len(history)), -1, -1):
+            table = self.get_context(history[len(history) - order:])
+            if table is None:
+                continue
+
+            total_frequency = 0
+            distinct = 0
+            frequency = 0
+            for term, count in table.items():
+                if term in excluded:
+                    continue
+                if term == msg_term:
+                    cumulative_frequency = total_frequency
+                    frequency = count
+                total_frequency += count
+                distinct += 1
+            if not distinct:
+                continue
+
+            # the escape takes the top of the interval with a frequency of the number of distinct symbols
+            if frequency:
+                encoder.encode(cumulative_frequency, frequency, total_frequency + distinct)
+                return
+            encoder.encode(total_frequency, distinct, total_frequency + distinct)
+            excluded.update(table)
+
+        cumulative_frequency = msg_term - sum(1 for term in excluded if term < msg_term)
+        encoder.encode(cumulative_frequency, 1, END_OF_STREAM + 1 - len(excluded))
+
+    def decode(self, decoder, history):
+        '''
+        Decodes a symbol
 
-            decoded_msg = decoded_msg + msg_term
-            stage_min = stage_probs[msg_term][0]
-            stage_max = stage_probs[msg_term][1]
+        Parameters:
+            decoder: the RangeDecoder
+            history: the previous bytes of the message, at most order of them
 
-            decoder.append(stage_probs)
+        Return:
+            The decoded symbol
+        '''
+        excluded = set()
+        for order in range(min(self.order, len(history)), -1, -1):
+            table = self.get_context(history[len(history) - order:])
+            if table is None:
+                continue
+
+            total_frequency = 0
+            distinct = 0
+            for term, count in table.items():
+                if term not in excluded:
+                    total_frequency += count
+                    distinct += 1
+            if not distinct:
+                continue
+
+            target = decoder.get_frequency(total_frequency + distinct)
+            if target >= total_frequency:
+                decoder.decode(total_frequency, distinct)
+                excluded.update(table)
+                continue
+
+            cumulative_frequency = 0
+            for term, count in table.items():
+                if term in excluded:
+                    continue
+                if target < cumulative_frequency + count:
+                    decoder.decode(cumulative_frequency, count)
+                    return term
+                cumulative_frequency += count
+
+        cumulative_frequency = decoder.get_frequency(END_OF_STREAM + 1 - len(excluded))
+        decoder.decode(cumulative_frequency, 1)
+        rank = cumulative_frequency
+        for msg_term in range(END_OF_STREAM + 1):
+            if msg_term in excluded:
+                continue
+            if not rank:
+                return msg_term
+            rank -= 1
+
+    def update(self, history, msg_term):
+        '''
+        Counts the symbol in every context from order 0 up to the full history
 
-        stage_probs = self.process_stage(probability_table, stage_min, stage_max)
-        decoder.append(stage_probs)
+        Parameters:
+            history: the previous bytes of the message, at most order of them
+            msg_term: the symbol that followed them
+        '''
+        for order in range(min(self.order, len(history)) + 1):
+            context = history[len(history) - order:]
+            table = self.get_context(context)
+            if table is None:
+                if len(self.contexts) >= self.max_contexts:
+                    self.contexts.popitem(last=False)
+                table = self.contexts[context] = {}
+
+            count = table.get(msg_term, 0) + 1
+            table[msg_term] = count
+            if count >= MAX_CONTEXT_COUNT:
+                for term in table:
+                    table[term] = (table[term] + 1) // 2
+
+class ContextArithmeticEncoding:
+    '''
+    Single pass arithmetic encoding of bytes driven by an order-k ContextModel
+    '''
+    def __init__(self, order=CONTEXT_ORDER, max_contexts=MAX_CONTEXTS):
+        self.order = order
+        self.max_contexts = max_contexts
 
-        return decoder, decoded_msg
+    def encode(self, msg):
+        '''
+        Encodes the message
 
+        Parameters:
+            msg: The bytes to be encoded
 
-def encode_file(file_to_be_encoded):
+        Return:
+            Encoded message
+        '''
+        return b''.join(self.encode_stream([msg]))
+
+    def encode_stream(self, msg_chunks):
+        '''
+        Encodes a message given in consecutive chunks, ending it with the end of stream marker
+
+        Parameters:
+            msg_chunks: An iterable of the parts of the message to be encoded, as bytes
+
+        Return:
+            A generator of the encoded bytes, produced as soon as CHUNK_SIZE of them are ready
+        '''
+        model = ContextModel(self.order, self.max_contexts)
+        encoder = RangeEncoder()
+        order = self.order
+        history = b''
+        for msg_chunk in msg_chunks:
+            for msg_term in msg_chunk:
+                model.encode(encoder, history, msg_term)
+                model.update(history, msg_term)
+                history = (history + bytes((msg_term,)))[max(0, len(history) + 1 - order):]
+
+            if len(encoder.output) >= CHUNK_SIZE:
+                yield encoder.take_output()
+
+        model.encode(encoder, history, END_OF_STREAM)
+        report('context arithmetic', 'encode', order=order, contexts=len(model.contexts))
+        yield encoder.finish()
+
+    def decode(self, encoded_msg):
+        """
+        Decodes a message from the encoded bytes.
+
+        Parameters:
+            encoded_msg: The encoded message.
+
+        Return:
+            Decoded message.
+        """
+        return b''.join(self.decode_stream([encoded_msg]))
+
+    def decode_stream(self, encoded_chunks):
+        """
+        Decodes a message given in consecutive chunks of encoded bytes, up to the end of stream marker
+
+        Parameters:
+            encoded_chunks: An iterable of the encoded bytes
+
+        Return:
+            A generator of the decoded bytes, in parts of CHUNK_SIZE bytes
+        """
+        model = ContextModel(self.order, self.max_contexts)
+        range_decoder = RangeDecoder(b'', encoded_chunks)
+        order = self.order
+        history = b''
+        decoded_msg = bytearray()
+        while True:
+            msg_term = model.decode(range_decoder, history)
+            if msg_term == END_OF_STREAM:
+                break
+            model.update(history, msg_term)
+            history = (history + bytes((msg_term,)))[max(0, len(history) + 1 - order):]
+
+            decoded_msg.append(msg_term)
+            if len(decoded_msg) >= CHUNK_SIZE:
+                yield bytes(decoded_msg)
+                decoded_msg = bytearray()
+
+        yield bytes(decoded_msg)
+
+
+def encode_file(file_to_be_encoded, checksum=None):
     """
     Driver code to encode a file
 
     Parameters:
          file_to_be_encoded: name of the file to be encoded
+         checksum: optional StreamChecksum updated with the data read
     
     Return:
-        Name of encoded file, encoded message lengths and frequency table
+        Name of encoded file
     """
     freq_table = {}
-    with open(file_to_be_encoded) as f:
-        for line in f.readlines():
-            for char in line:
-                if char not in freq_table:
-                    freq_table[char] = 1
-                else:
-                    freq_table[char] += 1
+    with phase('arithmetic', 'model') as model_phase:
+        with open(file_to_be_encoded, "rb") as f:
+            for block in map_blocks(f):
+                for char in block:
+                    if char not in freq_table:
+                        freq_table[char] = 1
+                    else:
+                        freq_table[char] += 1
+        model_phase.add(symbols=len(freq_table))
+
+    with phase('arithmetic', 'table', symbols=len(freq_table)):
+        AE = ArithmeticEncoding(freq_table)
 
-    AE = ArithmeticEncoding(freq_table)
+    logger.debug("Arithmetic Encoding Probability table %s", AE.probability_table)
 
-    print()
-    print("Arithmetic Encoding Probability table")
-    print(AE.probability_table)
-    encoded_msg_len = []
+    # the whole file is encoded as a single message, streamed block by block
+    encoded_msg_len = sum(freq_table.values())
 
     enc_msg_file = "./Encoded_Files/" + file_to_be_encoded.split('/')[-1].split('.')[0] + "_AE_encoded"
-    with open(enc_msg_file, "w") as enc_file:
-        with open(file_to_be_encoded) as f:
-            for line in f.readlines():
-                encoded_msg_len.append(len(line))
-                encoded_msg = AE.encode(msg=line,
-                                        probability_table=AE.probability_table)
-                enc_file.write(str(encoded_msg))
-                enc_file.write("\n")
-
-    return enc_msg_file, encoded_msg_len, freq_table
-
-def decode_file(encoded_file, encoded_msg_len, frequency_table, decode_to_file):
+    with open(enc_msg_file, "wb") as enc_file:
+        # the header makes the file decodable on its own
+        enc_file.write(pack(FILE_HEADER_FORMAT, encoded_msg_len, len(AE.frequency_table)))
+        for symbol, frequency in AE.frequency_table.items():
+            enc_file.write(pack(FILE_SYMBOL_FORMAT, symbol, frequency))
+
+        with phase('arithmetic', 'encode', data_bytes=encoded_msg_len) as encode_phase:
+            with open(file_to_be_encoded, "rb") as f:
+                blocks = map_blocks(f)
+                if checksum is not None:
+                    blocks = checksum.update(blocks)
+                encode_phase.add(encoded_bytes=write_blocks(AE.encode_stream(blocks), enc_file))
+
+    return enc_msg_file
+
+def decode_file(encoded_file, decode_to_file, checksum=None):
     """
-    Driver code to decode a file
+    Driver code to decode a file, the message length and frequency table are read from its header
 
     Parameters:
          encoded_file: name of the encoded file
-         encoded_msg_len: length of encoded messages
-         frequency_table: a dictionary with the frequency for each symbol
          decode_to_file: filename to be used while creating the decoded file
+         checksum: optional StreamChecksum updated with the decoded data
     
     Return:
         None
     """
-    dec_file = open(decode_to_file, "w")
-    AE = ArithmeticEncoding(frequency_table)
+    with open(encoded_file, "rb") as enc_file:
+        encoded_msg_len, symbol_count = unpack(FILE_HEADER_FORMAT, enc_file.read(FILE_HEADER_SIZE))
+        frequency_table = {}
+        for _ in range(symbol_count):
+            symbol, frequency = unpack(FILE_SYMBOL_FORMAT, enc_file.read(FILE_SYMBOL_SIZE))
+            frequency_table[symbol] = frequency
+
+        with open(decode_to_file, "wb") as dec_file:
+            if encoded_msg_len:
+                with phase('arithmetic', 'table', symbols=symbol_count):
+                    AE = ArithmeticEncoding(frequency_table)
+                with phase('arithmetic', 'decode', data_bytes=encoded_msg_len):
+                    blocks = AE.decode_stream(map_blocks(enc_file), encoded_msg_len)
+                    if checksum is not None:
+                        blocks = checksum.update(blocks)
+                    write_blocks(blocks, dec_file)
+
+def encode_file_adaptive(file_to_be_encoded, context_order=None, checksum=None):
+    """
+    Driver code to encode a file in a single pass with the adaptive model
+
+    Parameters:
+         file_to_be_encoded: name of the file to be encoded
+         context_order: order of the context model to use instead of the order-0 adaptive model, at most 255,
+                        0 standing for the order-0 adaptive model
+         checksum: optional StreamChecksum updated with the data read
+
+    Return:
+        Name of encoded file
+    """
+    # the order is stored in a single byte of the header, 0 being decoded with the order-0 adaptive model
+    if context_order is not None and not 0 <= context_order <= 255:
+        raise ValueError("context order out of range: {}".format(context_order))
+    if not context_order:
+        AE = AdaptiveArithmeticEncoding()
+        codec = 'adaptive arithmetic'
+        suffix = "_AE_adaptive_encoded"
+    else:
+        AE = ContextArithmeticEncoding(context_order)
+        codec = 'context arithmetic'
+        suffix = "_AE_context_encoded"
+
+    enc_msg_file = "./Encoded_Files/" + file_to_be_encoded.split('/')[-1].split('.')[0] + suffix
+    with open(enc_msg_file, "wb") as enc_file:
+        enc_file.write(pack(ADAPTIVE_HEADER_FORMAT, context_order or 0))
+        with phase(codec, 'encode file') as encode_phase:
+            with open(file_to_be_encoded, "rb") as f:
+                blocks = map_blocks(f)
+                if checksum is not None:
+                    blocks = checksum.update(blocks)
+                encode_phase.add(encoded_bytes=write_blocks(AE.encode_stream(blocks), enc_file))
+
+    return enc_msg_file
+
+def decode_file_adaptive(encoded_file, decode_to_file, checksum=None):
+    """
+    Driver code to decode a file encoded with the adaptive model, the context order is read from its header
 
-    with open(encoded_file) as enc_file:
-        for i, encoded_msg in enumerate(enc_file.readlines()):
-            _, decoded_msg = AE.decode(encoded_msg=Decimal(encoded_msg),
-                                  msg_length=encoded_msg_len[i],
-                                  probability_table=AE.probability_table)
-            dec_file.write(decoded_msg)    
+    Parameters:
+         encoded_file: name of the encoded file
+         decode_to_file: filename to be used while creating the decoded file
+         checksum: optional StreamChecksum updated with the decoded data
 
-    dec_file.close()
+    Return:
+        None
+    """
+    with open(encoded_file, "rb") as enc_file:
+        (context_order, ) = unpack(ADAPTIVE_HEADER_FORMAT, enc_file.read(1))
+        if context_order:
+            AE = ContextArithmeticEncoding(context_order)
+            codec = 'context arithmetic'
+        else:
+            AE = AdaptiveArithmeticEncoding()
+            codec = 'adaptive arithmetic'
+
+        with phase(codec, 'decode file') as decode_phase:
+            with open(decode_to_file, "wb") as dec_file:
+                blocks = AE.decode_stream(map_blocks(enc_file))
+                if checksum is not None:
+                    blocks = checksum.update(blocks)
+                decode_phase.add(decoded_bytes=write_blocks(blocks, dec_file))
 
 def verify(original_file, decoded_file):    
     """
@@ -217,14 +857,11 @@ def verify(original_file, decoded_file):
     Return:
         True if the files match, false otherwise
     """
-    text1 = open(original_file).read()
-    text2 = open(decoded_file).read()
-    m = SequenceMatcher(None, text1, text2)
-    
-    if m.ratio() == 1.0:
-        return True
-    
-    return False
+    offset = first_mismatch(original_file, decoded_file)
+    if offset is not None:
+        logger.warning("Original and Decoded file differ from byte %d", offset)
+        return False
+    return True
 
 def get_compression_ratio(original_file, encoded_file):
     """
@@ -237,40 +874,55 @@ def get_compression_ratio(original_file, encoded_file):
         Original file size, Encoded file size, Compression ratio
     """
     og_size = getsize(original_file)
-    enc_size = 0
-    with open(encoded_file) as f:
-        enc_size = 16 * len(f.readlines())
+    enc_size = getsize(encoded_file)
 
     ratio = og_size/enc_size
     return og_size, enc_size, ratio
 
-def do_Arithmetic_Encoding(file_to_be_encoded):
+def do_Arithmetic_Encoding(file_to_be_encoded, adaptive=False, context_order=None):
     """
     Driver function for Arithmetic encoding
 
     Parameters:
         file_to_be_encoded: name of the file to be encoded
+        adaptive: use the single pass adaptive model instead of the static frequency table
+        context_order: use a single pass context model of that order instead of the static frequency table
     
     Return:
         Original file size in kB, Encoded file size in kB, Time taken for encoding, Time taken for decoding
     """
+    adaptive = adaptive or context_order is not None
+
+    original_checksum = StreamChecksum()
+    decoded_checksum = StreamChecksum()
+
     start = timer()
-    encoded_file, encoded_msg_len, freq_table = encode_file(file_to_be_encoded)
+    if adaptive:
+        encoded_file = encode_file_adaptive(file_to_be_encoded, context_order, original_checksum)
+    else:
+        encoded_file = encode_file(file_to_be_encoded, original_checksum)
     end = timer()
 
     enc_time = end - start
 
-    decode_to_file = "./Decoded_Files/" + file_to_be_encoded.split('/')[-1].split('.')[0] + "_AE_decoded"
+    decode_to_file = "./Decoded_Files/" + file_to_be_encoded.split('/')[-1].split('.')[0] + ("_AE_decoded" if not adaptive else "_AE_adaptive_decoded" if not context_order else "_AE_context_decoded")
 
     start = timer()
-    decode_file(encoded_file, encoded_msg_len, freq_table, decode_to_file)
+    if adaptive:
+        decode_file_adaptive(encoded_file, decode_to_file, decoded_checksum)
+    else:
+        decode_file(encoded_file, decode_to_file, decoded_checksum)
     end = timer()
 
     dec_time = end - start
 
     og_size, enc_size, ratio = get_compression_ratio(file_to_be_encoded, encoded_file)
 
-    result = verify(file_to_be_encoded, decode_to_file)
-    print("Original and Decoded file", "MATCH!" if result == 1.0 else "DO NOT MATCH!")
+    with phase('arithmetic', 'verify'):
+        result = original_checksum.matches(decoded_checksum) or verify(file_to_be_encoded, decode_to_file)
+    if result:
+        logger.info("Original and Decoded file MATCH!")
+    else:
+        logger.warning("Original and Decoded file DO NOT MATCH!")
     
     return (og_size/1024, enc_size/1024, enc_time, dec_time)
@@ -0,0 +1,336 @@
+import re
+from struct import calcsize, pack, unpack_from
+
+try:
+    import numpy as np
+except ImportError:
+    # the suffix array and the inverse transform are computed in pure Python instead
+    np = None
+
+import Arithematic_Encoding
+import Huffman_Encoding
+from Instrumentation import phase
+from Stream_IO import frame_blocks, read_frames
+
+# Entropy coders the transformed block can be fed to
+BACK_ENDS = {'huffman': 0, 'arithmetic': 1}
+BACK_END_NAMES = {back_end_id: name for name, back_end_id in BACK_ENDS.items()}
+
+# An encoded block is a sequence of parts, each one transforming at most BWT_BLOCK_SIZE bytes of the block.
+# A part starts with the back end id, the row of the original data among the sorted rotations and the length
+# of the entropy coded data following it
+PART_HEADER_FORMAT = '>BII'
+PART_HEADER_SIZE = calcsize(PART_HEADER_FORMAT)
+
+# Runs of zeros in the move-to-front output are written as their length in bijective base 2, the byte RUN_A standing
+# for the digit 1 and the byte RUN_B for the digit 2. Other values go up by one, and the two largest ones, which would
+# not fit in a byte, are written as ESCAPE followed by the value - 254
+RUN_A = 0
+RUN_B = 1
+ESCAPE = 255
+SHIFT_UP = bytes(range(1, 256)) + b'\x00'
+SHIFT_DOWN = b'\x00' + bytes(range(255))
+RUN_LENGTH_TOKENS = re.compile(b'[\\x00\\x01]+|\\xff.|[\\x02-\\xfe]+', re.DOTALL)
+
+# Building the suffix array takes about 60 bytes per input byte, so blocks are transformed in parts of at most 1 MiB.
+# The sort keys of suffix_array, the products of two ranks, only fit in 64 bits for data of less than 3 GB
+BWT_BLOCK_SIZE = 1 << 20
+
+def suffix_array(data):
+    '''
+        Sorts the suffixes of the data followed by a sentinel smaller than any byte, by prefix doubling:
+        every round sorts the suffixes by the ranks of their first k bytes and of the k bytes after those
+
+        Parameters:
+            data: the bytes, less than 3 GB of them, see BWT_BLOCK_SIZE
+
+        Return:
+            The start of the suffixes in sorted order, len(data) + 1 of them, the first one being the sentinel
+    '''
+    size = len(data) + 1
+    if np is None:
+        rank = [byte + 1 for byte in data] + [0]
+        length = 1
+        while True:
+            base = max(rank) + 1
+            key = [rank[i] * base + (rank[i + length] if i + length < size else 0) for i in range(size)]
+            suffixes = sorted(range(size), key=key.__getitem__)
+            rank = [0] * size
+            for order in range(1, size):
+                rank[suffixes[order]] = rank[suffixes[order - 1]] + (key[suffixes[order]] != key[suffixes[order - 1]])
+            if rank[suffixes[-1]] == size - 1:
+                return suffixes
+            length *= 2
+
+    rank = np.zeros(size, np.int64)
+    rank[:-1] = np.frombuffer(data, np.uint8)
+    rank[:-1] += 1
+    length = 1
+    while True:
+        # a suffix shorter than the doubled prefix already has a rank of its own, the sentinel being unique
+        following = np.zeros(size, np.int64)
+        following[:max(size - length, 0)] = rank[length:]
+        key = rank * (int(rank.max()) + 1) + following
+        suffixes = np.argsort(key)
+        sorted_key = key[suffixes]
+        rank = np.empty(size, np.int64)
+        rank[suffixes[0]] = 0
+        rank[suffixes[1:]] = np.cumsum(sorted_key[1:] != sorted_key[:-1])
+        if rank[suffixes[-1]] == size - 1:
+            return suffixes
+        length *= 2
+
+def transform(data):
+    '''
+        Burrows-Wheeler transform: the byte preceding every suffix in sorted order
+
+        Parameters:
+            data: the bytes
+
+        Return:
+            The transformed bytes, without the sentinel, and the row of the sentinel
+    '''
+    suffixes = suffix_array(data)
+    if np is None:
+        primary = suffixes.index(0)
+        return bytes(data[suffix - 1] for suffix in suffixes if suffix), primary
+
+    primary = int(np.flatnonzero(suffixes == 0)[0])
+    preceding = np.delete(suffixes, primary) - 1
+    return np.frombuffer(data, np.uint8)[preceding].tobytes(), primary
+
+def inverse_transform(transformed, primary):
+    '''
+        Reverses transform by following every row to the row of the next suffix
+
+        Parameters:
+            transformed: the transformed bytes
+            primary: the row of the sentinel
+
+        Return:
+            The original bytes
+    '''
+    last_column = transformed[:primary] + b'\x00' + transformed[primary:]
+    if np is None:
+        # rows of the first column start with the sentinel, then with every byte in order
+        counts = [0] * 256
+        for byte in transformed:
+            counts[byte] += 1
+        starts = []
+        total = 1
+        for count in counts:
+            starts.append(total)
+            total += count
+        next_row = [0] * len(last_column)
+        next_row[0] = primary
+        for row, byte in enumerate(last_column):
+            if row != primary:
+                next_row[starts[byte]] = row
+                starts[byte] += 1
+    else:
+        symbols = np.frombuffer(last_column, np.uint8).astype(np.int16)
+        symbols[primary] = -1
+        next_row = np.argsort(symbols, kind='stable').tolist()
+
+    decoded = bytearray(len(transformed))
+    row = primary
+    for position in range(len(transformed)):
+        row = next_row[row]
+        decoded[position] = last_column[row]
+    return bytes(decoded)
+
+def move_to_front(data):
+    '''
+        Replaces every byte with its position in a list of the bytes, most recently used first
+
+        Parameters:
+            data: the bytes
+
+        Return:
+            The positions
+    '''
+    table = bytearray(range(256))
+    output = bytearray(len(data))
+    for position, byte in enumerate(data):
+        index = table.index(byte)
+        if index:
+            output[position] = index
+            del table[index]
+            table.insert(0, byte)
+    return bytes(output)
+
+def move_to_front_decode(indexes):
+    table = bytearray(range(256))
+    output = bytearray(len(indexes))
+    for position, index in enumerate(indexes):
+        byte = table[index]
+        output[position] = byte
+        if index:
+            del table[index]
+            table.insert(0, byte)
+    return bytes(output)
+
+def run_length_encode(indexes):
+    '''
+        Codes the runs of zeros of the move-to-front output, see RUN_A
+
+        Parameters:
+            indexes: the move-to-front output
+
+        Return:
+            The coded bytes
+    '''
+    output = bytearray()
+    # re.split alternates the runs of other values with the runs of zeros
+    for number, part in enumerate(re.split(b'(\x00+)', indexes)):
+        if number % 2:
+            run = len(part)
+            while run:
+                if run & 1:
+                    output.append(RUN_A)
+                    run = (run - 1) >> 1
+                else:
+                    output.append(RUN_B)
+                    run = (run - 2) >> 1
+        elif b'\xfe' in part or b'\xff' in part:
+            for index in part:
+                if index < ESCAPE - 1:
+                    output.append(index + 1)
+                else:
+                    output += bytes((ESCAPE, index - ESCAPE + 1))
+        else:
+            output += part.translate(SHIFT_UP)
+    return bytes(output)
+
+def run_length_decode(coded):
+    output = bytearray()
+    for token in RUN_LENGTH_TOKENS.findall(coded):
+        if token[0] <= RUN_B:
+            run = 0
+            for digit, symbol in enumerate(token):
+                run += (symbol + 1) << digit
+            output += bytes(run)
+        elif token[0] == ESCAPE:
+            output.append(token[1] + ESCAPE - 1)
+        else:
+            output += token.translate(SHIFT_DOWN)
+    return bytes(output)
+
+def encode_block(data, back_end='huffman'):
+    '''
+        Transforms a block with the Burrows-Wheeler transform, move-to-front and the coding of the runs of zeros,
+        then entropy codes it. Blocks larger than BWT_BLOCK_SIZE are split into parts coded on their own
+
+        Parameters:
+            data: the bytes
+            back_end: 'huffman' or 'arithmetic'
+
+        Return:
+            The encoded bytes
+    '''
+    if back_end not in BACK_ENDS:
+        raise ValueError("unknown back end: {}".format(back_end))
+    return b''.join(encode_part(data[start:start + BWT_BLOCK_SIZE], back_end) for start in range(0, len(data), BWT_BLOCK_SIZE))
+
+def encode_part(data, back_end):
+    '''
+        Encodes a part of a block, see encode_block
+
+        Parameters:
+            data: the bytes, at most BWT_BLOCK_SIZE of them
+            back_end: 'huffman' or 'arithmetic'
+
+        Return:
+            The part header followed by the encoded bytes
+    '''
+    with phase('bwt', 'suffix array', data_bytes=len(data)):
+        transformed, primary = transform(data)
+    with phase('bwt', 'move to front', data_bytes=len(data)):
+        indexes = move_to_front(transformed)
+    with phase('bwt', 'run length') as run_length_phase:
+        coded = run_length_encode(indexes)
+        run_length_phase.add(coded_bytes=len(coded))
+
+    if back_end == 'huffman':
+        encoded = Huffman_Encoding.Huffman_Encode_Block(coded)
+    else:
+        encoded = Arithematic_Encoding.AdaptiveArithmeticEncoding().encode(coded)
+    return pack(PART_HEADER_FORMAT, BACK_ENDS[back_end], primary, len(encoded)) + encoded
+
+def decode_block(encoded):
+    '''
+        Decodes a block encoded by encode_block
+
+        Parameters:
+            encoded: the encoded bytes
+
+        Return:
+            The decoded bytes
+    '''
+    parts = []
+    offset = 0
+    while offset < len(encoded):
+        if len(encoded) - offset < PART_HEADER_SIZE:
+            raise ValueError("truncated part header")
+        back_end_id, primary, encoded_length = unpack_from(PART_HEADER_FORMAT, encoded, offset)
+        offset += PART_HEADER_SIZE
+        if len(encoded) - offset < encoded_length:
+            raise ValueError("truncated part")
+        parts.append(decode_part(back_end_id, primary, encoded[offset:offset + encoded_length]))
+        offset += encoded_length
+    return b''.join(parts)
+
+def decode_part(back_end_id, primary, encoded):
+    '''
+        Decodes a part of a block, see decode_block
+
+        Parameters:
+            back_end_id: the back end id of the part header
+            primary: the row of the original data of the part header
+            encoded: the entropy coded bytes following the part header
+
+        Return:
+            The decoded bytes
+    '''
+    back_end = BACK_END_NAMES.get(back_end_id)
+    if back_end == 'huffman':
+        coded = Huffman_Encoding.Huffman_Decoding(encoded)
+    elif back_end == 'arithmetic':
+        coded = Arithematic_Encoding.AdaptiveArithmeticEncoding().decode(encoded)
+    else:
+        raise ValueError("unknown back end id: {}".format(back_end_id))
+
+    with phase('bwt', 'run length decode', coded_bytes=len(coded)):
+        indexes = run_length_decode(coded)
+    with phase('bwt', 'move to front decode', data_bytes=len(indexes)):
+        transformed = move_to_front_decode(indexes)
+    if primary > len(transformed):
+        raise ValueError("corrupted block")
+    with phase('bwt', 'inverse', data_bytes=len(transformed)):
+        return inverse_transform(transformed, primary)
+
+def encode_stream(data_blocks, back_end='huffman'):
+    '''
+        Encodes a stream of bytes block by block, every block prefixed with its encoded length
+
+        Parameters:
+            data_blocks: iterable of the blocks of bytes to be encoded
+            back_end: 'huffman' or 'arithmetic'
+
+        Return:
+            A generator of the encoded bytes
+    '''
+    return frame_blocks(encode_block(block, back_end) for block in data_blocks if block)
+
+def decode_stream(encoded_chunks):
+    '''
+        Decodes a stream encoded by encode_stream
+
+        Parameters:
+            encoded_chunks: iterable of the encoded bytes
+
+        Return:
+            A generator of the decoded blocks
+    '''
+    for encoded_block in read_frames(encoded_chunks):
+        yield decode_block(encoded_block)
@@ -0,0 +1,324 @@
+import argparse
+import csv
+import json
+import platform
+import random
+import sys
+import tracemalloc
+from gc import collect
+from math import ceil
+from os import listdir
+from os.path import isfile, join
+from statistics import median
+from timeit import default_timer as timer
+
+from Block_Encoding import CODECS, decode_block, encode_block
+from Instrumentation import MetricsRecorder, add_sink, remove_sink
+
+# Codecs benchmarked by default, as 'codec' or 'codec:parameter' (see Block_Encoding.BLOCK_HEADER_FORMAT)
+DEFAULT_CODECS = ['huffman', 'lzw', 'arithmetic', 'arithmetic:3', 'lzss', 'lzss:1', 'bwt', 'bwt:1', 'auto']
+
+SYNTHETIC_CORPORA = ['random', 'text', 'repetitive']
+SYNTHETIC_SIZE = 1 << 20
+SEED = 0
+
+# Words drawn with a Zipf-like distribution make up the synthetic text corpus
+WORDS = ("the of and to a in that is was he for it with as his on be at by i this had not are but from or have an "
+         "they which one you were her all she there would their we him been has when who will more no if out so said "
+         "what up its about into than them can only other new some could time these two may then do first any my now "
+         "such like our over man me even most made after also did many before must through back years where much your "
+         "way well down should because each just those people how too little state good very make world still own see "
+         "men work long get here between both life being under never day same another know while last might us great "
+         "old year off come since against go came right used take three").split()
+
+def percentile(values, fraction):
+    '''
+        Nearest-rank percentile
+
+        Parameters:
+            values: list of numbers
+            fraction: the percentile as a fraction, 0.95 for p95
+
+        Return:
+            The percentile
+    '''
+    values = sorted(values)
+    rank = min(len(values), max(1, ceil(fraction * len(values)))) - 1
+    return values[rank]
+
+def make_synthetic_corpus(kind, size, seed=SEED):
+    '''
+        Generates a reproducible synthetic corpus
+
+        Parameters:
+            kind: 'random' (uniform bytes), 'text' (English-like words) or 'repetitive' (a short pattern with rare noise)
+            size: number of bytes
+            seed: seed of the random generator
+
+        Return:
+            The corpus bytes
+    '''
+    rng = random.Random(seed)
+    if kind == 'random':
+        return rng.randbytes(size)
+    if kind == 'text':
+        weights = [1 / (rank + 1) for rank in range(len(WORDS))]
+        data = bytearray()
+        while len(data) < size:
+            line = rng.choices(WORDS, weights, k=rng.randint(4, 14))
+            data += (" ".join(line).capitalize() + ".\n").encode()
+        return bytes(data[:size])
+    if kind == 'repetitive':
+        pattern = rng.randbytes(64)
+        data = bytearray((pattern * (size // len(pattern) + 1))[:size])
+        for _ in range(size // 1000):
+            data[rng.randrange(size)] = rng.randrange(256)
+        return bytes(data)
+    raise ValueError("unknown synthetic corpus: {}".format(kind))
+
+def parse_codec(spec):
+    '''
+        Splits a codec specification into the codec and its parameter
+
+        Parameters:
+            spec: 'codec' or 'codec:parameter'
+
+        Return:
+            The codec name and parameter
+    '''
+    codec, _, parameter = spec.partition(':')
+    if codec not in CODECS:
+        raise ValueError("unknown codec: {}".format(codec))
+    return codec, int(parameter or 0)
+
+def time_runs(function, argument, runs, warmup):
+    '''
+        Times a function over repeated runs after some warmup runs
+
+        Parameters:
+            function: function taking a single argument
+            argument: the argument
+            runs: number of timed runs
+            warmup: number of untimed runs
+
+        Return:
+            The result of the last run and the list of run times in seconds
+    '''
+    for _ in range(warmup):
+        result = function(argument)
+
+    times = []
+    for _ in range(runs):
+        collect()
+        start = timer()
+        result = function(argument)
+        times.append(timer() - start)
+    return result, times
+
+def peak_memory(function, argument):
+    '''
+        Measures the peak memory allocated by a function, in a separate run as tracing slows it down
+
+        Parameters:
+            function: function taking a single argument
+            argument: the argument
+
+        Return:
+            The peak memory in bytes
+    '''
+    collect()
+    tracemalloc.start()
+    try:
+        function(argument)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def phase_totals(function, argument):
+    '''
+        Runs a function once with a metrics recorder registered, in a separate run as recording slows it down
+
+        Parameters:
+            function: function taking a single argument
+            argument: the argument
+
+        Return:
+            A dictionary from 'codec/phase' to the totals of that phase
+    '''
+    recorder = add_sink(MetricsRecorder())
+    try:
+        function(argument)
+    finally:
+        remove_sink(recorder)
+    return {codec + '/' + name: total for (codec, name), total in recorder.totals().items()}
+
+def benchmark(spec, corpus, data, runs=5, warmup=1, memory=True, phases=False):
+    '''
+        Benchmarks one codec on one corpus, the data being encoded as a single in-memory block so that
+        neither file I/O nor printing is timed
+
+        Parameters:
+            spec: 'codec' or 'codec:parameter'
+            corpus: name of the corpus
+            data: the corpus bytes
+            runs: number of timed runs
+            warmup: number of untimed runs
+            memory: whether to measure the peak memory
+            phases: whether to add the totals of the instrumented phases, see Instrumentation
+
+        Return:
+            A dictionary with the results
+    '''
+    codec, parameter = parse_codec(spec)
+    encode = lambda block: encode_block(codec, block, parameter)
+
+    encoded, encode_times = time_runs(encode, data, runs, warmup)
+    decoded, decode_times = time_runs(decode_block, encoded, runs, warmup)
+    if decoded != data:
+        raise ValueError("{} does not round-trip {}".format(spec, corpus))
+
+    size_mb = len(data) / (1 << 20)
+    result = {
+        'codec': spec,
+        'corpus': corpus,
+        'original_size': len(data),
+        'encoded_size': len(encoded),
+        'compression_ratio': len(data) / len(encoded),
+        'encode_median_s': median(encode_times),
+        'encode_p95_s': percentile(encode_times, 0.95),
+        'encode_mb_s': size_mb / median(encode_times),
+        'decode_median_s': median(decode_times),
+        'decode_p95_s': percentile(decode_times, 0.95),
+        'decode_mb_s': size_mb / median(decode_times),
+        'encode_peak_memory': None,
+        'decode_peak_memory': None,
+    }
+    if memory:
+        result['encode_peak_memory'] = peak_memory(encode, data)
+        result['decode_peak_memory'] = peak_memory(decode_block, encoded)
+    if phases:
+        result['encode_phases'] = phase_totals(encode, data)
+        result['decode_phases'] = phase_totals(decode_block, encoded)
+    return result
+
+def load_corpora(input_dir=None, synthetic=(), synthetic_size=SYNTHETIC_SIZE, seed=SEED):
+    '''
+        Loads the files of a directory and generates the synthetic corpora
+
+        Parameters:
+            input_dir: directory of the corpus files, if any
+            synthetic: kinds of synthetic corpora
+            synthetic_size: number of bytes of every synthetic corpus
+            seed: seed of the random generator
+
+        Return:
+            A list of (name, bytes) pairs
+    '''
+    corpora = []
+    if input_dir:
+        for name in sorted(listdir(input_dir)):
+            path = join(input_dir, name)
+            if isfile(path):
+                with open(path, "rb") as f:
+                    corpora.append((name, f.read()))
+    for kind in synthetic:
+        corpora.append(("synthetic-{}-{}".format(kind, synthetic_size), make_synthetic_corpus(kind, synthetic_size, seed)))
+    return corpora
+
+def write_results(results, output, output_format):
+    '''
+        Writes the benchmark results as JSON or CSV
+
+        Parameters:
+            results: dictionary with the environment and the list of results
+            output: file object
+            output_format: 'json' or 'csv'
+
+        Return:
+            None
+    '''
+    if output_format == 'json':
+        json.dump(results, output, indent=2)
+        output.write("\n")
+    else:
+        writer = csv.DictWriter(output, fieldnames=list(results['results'][0]) if results['results'] else ['codec'])
+        writer.writeheader()
+        writer.writerows(results['results'])
+
+def find_regressions(results, baseline, tolerance=0.1):
+    '''
+        Compares benchmark results with the results of a previous version
+
+        Parameters:
+            results: list of results of this version
+            baseline: list of results of the previous version
+            tolerance: relative loss allowed before reporting a regression
+
+        Return:
+            A list of messages, one per regression
+    '''
+    previous = {(result['codec'], result['corpus']): result for result in baseline}
+    regressions = []
+    for result in results:
+        old = previous.get((result['codec'], result['corpus']))
+        if old is None:
+            continue
+        for metric in ('compression_ratio', 'encode_mb_s', 'decode_mb_s'):
+            if result[metric] < old[metric] * (1 - tolerance):
+                regressions.append("{} on {}: {} went from {:.4g} to {:.4g}".format(
+                    result['codec'], result['corpus'], metric, old[metric], result[metric]))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the codecs over corpus files and synthetic corpora")
+    parser.add_argument('--codecs', nargs='+', default=DEFAULT_CODECS, help="codecs as codec or codec:parameter")
+    parser.add_argument('--input-dir', default="./Input_Files/", help="directory of corpus files, '' for none")
+    parser.add_argument('--synthetic', nargs='*', default=[], choices=SYNTHETIC_CORPORA, help="synthetic corpora")
+    parser.add_argument('--synthetic-size', type=int, default=SYNTHETIC_SIZE, help="bytes per synthetic corpus")
+    parser.add_argument('--seed', type=int, default=SEED, help="seed of the synthetic corpora")
+    parser.add_argument('--runs', type=int, default=5, help="timed runs per codec and corpus")
+    parser.add_argument('--warmup', type=int, default=1, help="untimed runs before the timed ones")
+    parser.add_argument('--no-memory', action='store_true', help="skip the peak memory measurement")
+    parser.add_argument('--phases', action='store_true', help="add per-phase metrics to the JSON output")
+    parser.add_argument('--format', choices=['json', 'csv'], default='json', help="output format")
+    parser.add_argument('--output', help="output file, standard output by default")
+    parser.add_argument('--baseline', help="JSON results of a previous version to check for regressions")
+    parser.add_argument('--tolerance', type=float, default=0.1, help="relative loss allowed against the baseline")
+    args = parser.parse_args(argv)
+
+    if args.runs < 1:
+        parser.error("--runs must be at least 1")
+    try:
+        specs = [spec for spec in args.codecs if parse_codec(spec)]
+    except ValueError as error:
+        parser.error(str(error))
+
+    results = {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'runs': args.runs,
+        'warmup': args.warmup,
+        'results': [],
+    }
+    for corpus, data in load_corpora(args.input_dir, args.synthetic, args.synthetic_size, args.seed):
+        for spec in specs:
+            results['results'].append(benchmark(spec, corpus, data, args.runs, args.warmup, not args.no_memory,
+                                                  args.phases and args.format == 'json'))
+
+    if args.output:
+        with open(args.output, "w", newline='') as output:
+            write_results(results, output, args.format)
+    else:
+        write_results(results, sys.stdout, args.format)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = find_regressions(results['results'], json.load(f)['results'], args.tolerance)
+        for regression in regressions:
+            print("regression:", regression, file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
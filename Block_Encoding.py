@@ -0,0 +1,300 @@
+import logging
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from os import cpu_count
+from os.path import getsize
+from struct import calcsize, pack, unpack, unpack_from
+from timeit import default_timer as timer
+from zlib import crc32
+
+import Arithematic_Encoding
+import BWT_Encoding
+import Huffman_Encoding
+import LZSS_Encoding
+import LZW_Encoding
+from Codec_Selection import choose_codec
+from Instrumentation import emit, enabled, phase, record_events
+from Stream_IO import first_mismatch, read_blocks
+
+logger = logging.getLogger(__name__)
+
+# Size of the independent blocks the input is split into
+BLOCK_SIZE = 1 << 20
+
+# Codec ids stored in the block headers. 'stored' keeps the bytes as they are, and 'auto' picks one of the others
+# for every block (see Codec_Selection), the block header recording the codec picked
+CODECS = {'auto': 0, 'huffman': 1, 'lzw': 2, 'arithmetic': 3, 'stored': 4, 'lzss': 5, 'bwt': 6}
+CODEC_NAMES = {codec_id: name for name, codec_id in CODECS.items()}
+
+# Every block starts with its codec id, codec parameter, original length, encoded length and the CRC32 of the original bytes.
+# The codes (Huffman) or the model (LZW dictionary, adaptive arithmetic model) are rebuilt from the block itself.
+# The parameter is the maximum code length for Huffman (0 for no limit) and the context order for arithmetic coding
+# (0 for the order-0 adaptive model), the level for LZSS (0 for LZSS_Encoding.DEFAULT_LEVEL) and the entropy coder fed
+# by the Burrows-Wheeler transform (see BWT_Encoding.BACK_ENDS), LZW and stored blocks have none, and neither has auto
+BLOCK_HEADER_FORMAT = '>BBIII'
+BLOCK_HEADER_SIZE = calcsize(BLOCK_HEADER_FORMAT)
+
+def get_arithmetic_encoding(parameter):
+    '''
+        Builds the arithmetic coder for a block parameter
+
+        Parameters:
+            parameter: the context order, 0 for the order-0 adaptive model
+
+        Return:
+            The arithmetic coder
+    '''
+    if parameter:
+        return Arithematic_Encoding.ContextArithmeticEncoding(parameter)
+    return Arithematic_Encoding.AdaptiveArithmeticEncoding()
+
+def encode_block(codec, data, parameter=0):
+    '''
+        Encodes a block independently from any other
+
+        Parameters:
+            codec: 'huffman', 'lzw', 'arithmetic', 'lzss', 'bwt', 'stored' or 'auto'
+            data: the bytes of the block
+            parameter: the codec parameter, see BLOCK_HEADER_FORMAT
+
+        Return:
+            The block header followed by the encoded bytes
+    '''
+    if codec == 'auto':
+        codec = choose_codec(data)
+        parameter = 0
+
+    with phase(codec, 'block encode', data_bytes=len(data)) as encode_phase:
+        if codec == 'stored':
+            encoded_data = bytes(data)
+        elif codec == 'huffman':
+            encoded_data = Huffman_Encoding.Huffman_Encode_Block(data, parameter or None)
+        elif codec == 'lzw':
+            encoded_data = b''.join(LZW_Encoding.encode_stream([data]))
+        elif codec == 'arithmetic':
+            encoded_data = get_arithmetic_encoding(parameter).encode(data)
+        elif codec == 'lzss':
+            encoded_data = LZSS_Encoding.encode_block(data, parameter or LZSS_Encoding.DEFAULT_LEVEL)
+        elif codec == 'bwt':
+            encoded_data = BWT_Encoding.encode_block(data, BWT_Encoding.BACK_END_NAMES.get(parameter))
+        else:
+            raise ValueError("unknown codec: {}".format(codec))
+        encode_phase.add(encoded_bytes=len(encoded_data))
+
+    header = pack(BLOCK_HEADER_FORMAT, CODECS[codec], parameter, len(data), len(encoded_data), crc32(data))
+    return header + encoded_data
+
+def decode_block(encoded_block):
+    '''
+        Decodes a block produced by encode_block and checks it against its CRC32
+
+        Parameters:
+            encoded_block: the block header followed by the encoded bytes
+
+        Return:
+            The bytes of the block
+    '''
+    if len(encoded_block) < BLOCK_HEADER_SIZE:
+        raise ValueError("truncated block header")
+    codec_id, parameter, length, encoded_length, checksum = unpack_from(BLOCK_HEADER_FORMAT, encoded_block)
+    encoded_data = encoded_block[BLOCK_HEADER_SIZE:BLOCK_HEADER_SIZE + encoded_length]
+    if len(encoded_data) != encoded_length:
+        raise ValueError("truncated block")
+
+    codec = CODEC_NAMES.get(codec_id)
+    with phase(codec, 'block decode', encoded_bytes=encoded_length, data_bytes=length):
+        if codec == 'stored':
+            data = encoded_data
+        elif codec == 'huffman':
+            data = Huffman_Encoding.Huffman_Decoding(encoded_data)
+        elif codec == 'lzw':
+            data = b''.join(LZW_Encoding.decode_stream([encoded_data]))
+        elif codec == 'arithmetic':
+            data = get_arithmetic_encoding(parameter).decode(encoded_data)
+        elif codec == 'lzss':
+            data = LZSS_Encoding.decode_block(encoded_data)
+        elif codec == 'bwt':
+            data = BWT_Encoding.decode_block(encoded_data)
+        else:
+            raise ValueError("unknown codec id: {}".format(codec_id))
+
+    if len(data) != length or crc32(data) != checksum:
+        raise ValueError("corrupted block")
+    return data
+
+def read_encoded_blocks(file_object):
+    '''
+        Reads the encoded blocks of a file one at a time
+
+        Parameters:
+            file_object: binary file object holding encoded blocks
+
+        Return:
+            A generator of the encoded blocks, headers included
+    '''
+    while True:
+        header = file_object.read(BLOCK_HEADER_SIZE)
+        if not header:
+            return
+        if len(header) != BLOCK_HEADER_SIZE:
+            raise ValueError("truncated block header")
+        encoded_length = unpack(BLOCK_HEADER_FORMAT, header)[3]
+        encoded_data = file_object.read(encoded_length)
+        if len(encoded_data) != encoded_length:
+            raise ValueError("truncated block")
+        yield header + encoded_data
+
+def map_in_order(function, items, workers=None):
+    '''
+        Runs a function on every item in worker processes and hands out the results in order,
+        with at most two items per worker in flight so that memory stays bounded. While instrumentation
+        is enabled, the events of every item are sent back with its result and emitted in the calling process
+
+        Parameters:
+            function: picklable function
+            items: iterable of arguments, each one a tuple
+            workers: number of worker processes, all the CPUs by default, 1 runs in the calling process
+
+        Return:
+            A generator of the results
+    '''
+    workers = workers or cpu_count()
+    if workers == 1:
+        for item in items:
+            yield function(*item)
+        return
+
+    forward_events = enabled()
+    with ProcessPoolExecutor(workers) as executor:
+        pending = deque()
+        for item in items:
+            if forward_events:
+                pending.append(executor.submit(record_events, function, *item))
+            else:
+                pending.append(executor.submit(function, *item))
+            if len(pending) >= 2 * workers:
+                yield collect_result(pending.popleft(), forward_events)
+        while pending:
+            yield collect_result(pending.popleft(), forward_events)
+
+def collect_result(future, forward_events):
+    '''
+        Waits for the result of a job of map_in_order, emitting the events sent back with it
+
+        Parameters:
+            future: the future of the job
+            forward_events: whether the job was run by Instrumentation.record_events
+
+        Return:
+            The result of the job
+    '''
+    if not forward_events:
+        return future.result()
+    result, events = future.result()
+    for event in events:
+        emit(event)
+    return result
+
+def encode_file(file_to_be_encoded, encoded_file, codec='huffman', block_size=BLOCK_SIZE, workers=None, parameter=0):
+    '''
+        Encodes a file in independent blocks, spread over worker processes
+
+        Parameters:
+            file_to_be_encoded: name of the file to be encoded
+            encoded_file: name of the encoded file
+            codec: 'huffman', 'lzw', 'arithmetic', 'lzss', 'bwt', 'stored' or 'auto'
+            block_size: number of bytes per block
+            workers: number of worker processes, all the CPUs by default
+            parameter: the codec parameter, see BLOCK_HEADER_FORMAT
+
+        Return:
+            Number of blocks
+    '''
+    if codec not in CODECS:
+        raise ValueError("unknown codec: {}".format(codec))
+
+    block_count = 0
+    with open(file_to_be_encoded, "rb") as f, open(encoded_file, "wb") as out:
+        blocks = ((codec, block, parameter) for block in read_blocks(f, block_size))
+        for encoded_block in map_in_order(encode_block, blocks, workers):
+            out.write(encoded_block)
+            block_count += 1
+
+    return block_count
+
+def decode_file(encoded_file, decode_to_file, workers=None):
+    '''
+        Decodes a file encoded by encode_file, spreading its blocks over worker processes
+
+        Parameters:
+            encoded_file: name of the encoded file
+            decode_to_file: name of the file used while writing the decoded output
+            workers: number of worker processes, all the CPUs by default
+
+        Return:
+            None
+    '''
+    with open(encoded_file, "rb") as f, open(decode_to_file, "wb") as out:
+        blocks = ((encoded_block, ) for encoded_block in read_encoded_blocks(f))
+        for data in map_in_order(decode_block, blocks, workers):
+            out.write(data)
+
+def decode_single_block(encoded_file, block_number):
+    '''
+        Decodes a single block of a file encoded by encode_file, skipping over the other blocks without decoding them
+
+        Parameters:
+            encoded_file: name of the encoded file
+            block_number: index of the block, starting at 0
+
+        Return:
+            The bytes of the block
+    '''
+    with open(encoded_file, "rb") as f:
+        for _ in range(block_number):
+            header = f.read(BLOCK_HEADER_SIZE)
+            if len(header) != BLOCK_HEADER_SIZE:
+                raise IndexError("block {} out of range".format(block_number))
+            f.seek(unpack(BLOCK_HEADER_FORMAT, header)[3], 1)
+
+        encoded_block = next(read_encoded_blocks(f), None)
+        if encoded_block is None:
+            raise IndexError("block {} out of range".format(block_number))
+        return decode_block(encoded_block)
+
+def do_Block_Encoding(file_to_be_encoded, codec='huffman', workers=None):
+    """
+    Driver function for parallel block encoding
+
+    Parameters:
+        file_to_be_encoded: name of the file to be encoded
+        codec: 'huffman', 'lzw', 'arithmetic', 'lzss', 'bwt', 'stored' or 'auto'
+        workers: number of worker processes, all the CPUs by default
+
+    Return:
+        Original file size in kB, Encoded file size in kB, Time taken for encoding, Time taken for decoding
+    """
+    name = file_to_be_encoded.split('/')[-1].split('.')[0]
+    encoded_file = "./Encoded_Files/" + name + "_" + codec + "_block_encoded"
+    decode_to_file = "./Decoded_Files/" + name + "_" + codec + "_block_decoded"
+
+    start = timer()
+    encode_file(file_to_be_encoded, encoded_file, codec, workers=workers)
+    end = timer()
+
+    enc_time = end - start
+
+    start = timer()
+    decode_file(encoded_file, decode_to_file, workers)
+    end = timer()
+
+    dec_time = end - start
+
+    with phase('block', 'verify'):
+        offset = first_mismatch(file_to_be_encoded, decode_to_file)
+    if offset is None:
+        logger.info("Original and Decoded file MATCH!")
+    else:
+        logger.warning("Original and Decoded file DO NOT MATCH from byte %d", offset)
+
+    return (getsize(file_to_be_encoded)/1024, getsize(encoded_file)/1024, enc_time, dec_time)
@@ -0,0 +1,81 @@
+from math import log2
+
+import Huffman_Encoding
+import LZW_Encoding
+from Instrumentation import report
+
+# The symbol counts are taken over at most SAMPLE_SIZE bytes, in SAMPLE_SLICES slices spread over the data
+SAMPLE_SIZE = 1 << 16
+SAMPLE_SLICES = 8
+
+# LZW is tried on at most LZW_TRIAL_SIZE bytes from the start of the data. Its dictionary keeps growing on
+# longer data, so the trial underestimates the gain of LZW on large inputs rather than overestimating it
+LZW_TRIAL_SIZE = 1 << 15
+
+# Arithmetic coding is many times slower than Huffman coding, it is only chosen when its estimate is smaller
+# than the Huffman one by this fraction
+ARITHMETIC_MIN_GAIN = 0.05
+
+def sample(data):
+    '''
+        Takes evenly spaced slices of the data
+
+        Parameters:
+            data: the bytes
+
+        Return:
+            The sampled bytes, the data itself when it is no larger than SAMPLE_SIZE
+    '''
+    if len(data) <= SAMPLE_SIZE:
+        return data
+    slice_size = SAMPLE_SIZE // SAMPLE_SLICES
+    step = (len(data) - slice_size) // (SAMPLE_SLICES - 1)
+    return b''.join(data[i * step:i * step + slice_size] for i in range(SAMPLE_SLICES))
+
+def estimate_sizes(data):
+    '''
+        Estimates the encoded size of the data with every codec from a small sample pass:
+        the order-0 entropy and the Huffman code lengths of the sampled symbol counts, and a short LZW trial run
+
+        Parameters:
+            data: the bytes
+
+        Return:
+            A dictionary from codec name ('stored', 'huffman', 'lzw' and 'arithmetic') to its estimated size in bytes
+    '''
+    sizes = {'stored': len(data)}
+    sampled = sample(data)
+    if not sampled:
+        return sizes
+
+    scale = len(data) / len(sampled)
+    symbol_with_probs = Huffman_Encoding.Calculate_Probability(sampled)
+    code_lengths = Huffman_Encoding.Build_Codes(symbol_with_probs)[0]
+    header_size = Huffman_Encoding.Header_Size(len(code_lengths), Huffman_Encoding.BYTE_SYMBOLS)
+    sizes['huffman'] = Huffman_Encoding.Encoded_Size(symbol_with_probs, code_lengths) / 8 * scale + header_size
+
+    # the adaptive model starts out uniform, paying about a byte for the first occurrence of every symbol
+    entropy = -sum(count * log2(count / len(sampled)) for count in symbol_with_probs.values())
+    sizes['arithmetic'] = entropy / 8 * scale + len(symbol_with_probs)
+
+    trial = data[:LZW_TRIAL_SIZE]
+    trial_size = sum(map(len, LZW_Encoding.encode_stream([trial])))
+    sizes['lzw'] = trial_size * len(data) / len(trial)
+    return sizes
+
+def choose_codec(data):
+    '''
+        Picks the codec expected to encode the data best, storing it as is when no codec would shrink it
+
+        Parameters:
+            data: the bytes
+
+        Return:
+            'stored', 'huffman', 'lzw' or 'arithmetic'
+    '''
+    sizes = estimate_sizes(data)
+    if sizes.get('arithmetic', 0) > sizes.get('huffman', 0) * (1 - ARITHMETIC_MIN_GAIN):
+        del sizes['arithmetic']
+    codec = min(sizes, key=sizes.get)
+    report('auto', 'select', data_bytes=len(data), chosen=codec, **{name + '_estimate': size for name, size in sizes.items()})
+    return codec
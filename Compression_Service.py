@@ -0,0 +1,350 @@
+import argparse
+import asyncio
+import logging
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from os import cpu_count
+from struct import calcsize, pack, unpack
+
+from Block_Encoding import BLOCK_HEADER_FORMAT, BLOCK_HEADER_SIZE, BLOCK_SIZE, CODECS, CODEC_NAMES, decode_block, encode_block
+
+logger = logging.getLogger(__name__)
+
+COMPRESS = 1
+DECOMPRESS = 2
+
+# A request is the operation, the codec id, the codec parameter and the length of the payload, followed by the payload.
+# Data is compressed into the blocks of Block_Encoding, so decompression needs no codec
+REQUEST_FORMAT = '>BBBI'
+REQUEST_SIZE = calcsize(REQUEST_FORMAT)
+
+# The response is streamed as frames of a status and a length followed by that many bytes: DATA frames
+# hold the output block by block, then a single END frame, or an ERROR frame holding the message
+RESPONSE_FORMAT = '>BI'
+RESPONSE_SIZE = calcsize(RESPONSE_FORMAT)
+DATA = 0
+END = 1
+ERROR = 2
+
+# Largest payload accepted in a request
+MAX_PAYLOAD_SIZE = 1 << 30
+
+# Blocks smaller than BATCH_THRESHOLD are gathered, up to BATCH_SIZE of them or for BATCH_DELAY seconds,
+# and sent to a worker process together
+BATCH_THRESHOLD = 1 << 16
+BATCH_SIZE = 64
+BATCH_DELAY = 0.002
+
+DEFAULT_PORT = 8765
+
+def run_job(operation, codec, data, parameter):
+    '''
+        Compresses or decompresses a block, in a worker process
+
+        Parameters:
+            operation: COMPRESS or DECOMPRESS
+            codec: 'huffman', 'lzw', 'arithmetic', 'lzss', 'bwt', 'stored' or 'auto', only used to compress
+            data: the block, an encoded block to decompress
+            parameter: the codec parameter, see Block_Encoding.BLOCK_HEADER_FORMAT
+
+        Return:
+            The encoded or decoded block
+    '''
+    if operation == COMPRESS:
+        return encode_block(codec, data, parameter)
+    return decode_block(data)
+
+def run_batch(jobs):
+    '''
+        Runs a batch of jobs in a worker process, the failure of one job not failing the others
+
+        Parameters:
+            jobs: list of the arguments of run_job
+
+        Return:
+            A list of (True, result) or (False, error message) pairs
+    '''
+    results = []
+    for job in jobs:
+        try:
+            results.append((True, run_job(*job)))
+        except Exception as error:
+            results.append((False, str(error)))
+    return results
+
+class CompressionService:
+    '''
+        Serves compress and decompress requests from a warm process, the blocks being coded in a process pool.
+        At most max_pending blocks are queued or running at any time, so a busy service stops reading requests
+        rather than buffering them
+    '''
+    def __init__(self, workers=None, block_size=BLOCK_SIZE, max_pending=None):
+        self.workers = workers or cpu_count()
+        self.block_size = block_size
+        self.max_pending = max_pending or 2 * self.workers
+        self.executor = None
+
+    async def start(self):
+        self.executor = ProcessPoolExecutor(self.workers)
+        self.pending = asyncio.Semaphore(self.max_pending)
+        self.batch_queue = asyncio.Queue()
+        self.batch_tasks = set()
+        self.batcher = asyncio.create_task(self.gather_batches())
+
+    async def close(self):
+        self.batcher.cancel()
+        for task in list(self.batch_tasks):
+            task.cancel()
+        # the worker processes are joined without blocking the event loop
+        await asyncio.get_running_loop().run_in_executor(None, partial(self.executor.shutdown, cancel_futures=True))
+
+    async def submit(self, operation, codec, data, parameter):
+        '''
+            Codes a block in the process pool, small blocks being batched. Any failure of the job is raised as ValueError
+
+            Return:
+                The encoded or decoded block
+        '''
+        future = asyncio.get_running_loop().create_future()
+        if len(data) < BATCH_THRESHOLD:
+            await self.batch_queue.put(((operation, codec, data, parameter), future))
+        else:
+            await self.run_batch([((operation, codec, data, parameter), future)])
+        return await future
+
+    async def gather_batches(self):
+        '''
+            Gathers the queued small blocks into batches, each batch running as soon as it is complete
+        '''
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.batch_queue.get()]
+            deadline = loop.time() + BATCH_DELAY
+            while len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(await asyncio.wait_for(self.batch_queue.get(), deadline - loop.time()))
+                except asyncio.TimeoutError:
+                    break
+            task = asyncio.create_task(self.run_batch(batch))
+            self.batch_tasks.add(task)
+            task.add_done_callback(self.batch_tasks.discard)
+
+    async def run_batch(self, batch):
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(self.executor, run_batch, [job for job, _ in batch])
+        except Exception as error:
+            results = [(False, str(error))] * len(batch)
+        for (_, future), (succeeded, result) in zip(batch, results):
+            if future.cancelled():
+                continue
+            if succeeded:
+                future.set_result(result)
+            else:
+                future.set_exception(ValueError(result))
+
+    async def handle(self, reader, writer):
+        '''
+            Serves the requests of a connection one after the other
+        '''
+        try:
+            while True:
+                try:
+                    header = await reader.readexactly(REQUEST_SIZE)
+                except asyncio.IncompleteReadError:
+                    return
+                operation, codec_id, parameter, length = unpack(REQUEST_FORMAT, header)
+                if length > MAX_PAYLOAD_SIZE:
+                    await self.send_error(writer, "payload too large")
+                    return
+                await self.respond(reader, writer, operation, codec_id, parameter, length)
+        except (ConnectionError, asyncio.IncompleteReadError) as error:
+            logger.info("connection lost: %s", error)
+        finally:
+            writer.close()
+
+    async def respond(self, reader, writer, operation, codec_id, parameter, length):
+        '''
+            Streams the response to a request, the blocks being coded in parallel and sent in order.
+            The payload is read a block at a time, each block only once a pending slot is free for it
+        '''
+        codec = CODEC_NAMES.get(codec_id)
+        if operation == COMPRESS and codec is not None:
+            read_block = self.read_data_block
+        elif operation == DECOMPRESS:
+            read_block = self.read_encoded_block
+        else:
+            await self.discard(reader, length)
+            await self.send_error(writer, "unknown operation {} or codec {}".format(operation, codec_id))
+            return
+
+        running = deque()
+        try:
+            while length:
+                await self.pending.acquire()
+                try:
+                    block = await read_block(reader, length)
+                except BaseException:
+                    self.pending.release()
+                    raise
+                length -= len(block)
+                task = asyncio.create_task(self.submit(operation, codec, block, parameter))
+                task.add_done_callback(lambda _: self.pending.release())
+                running.append(task)
+                if len(running) >= self.max_pending:
+                    await self.send_data(writer, await running.popleft())
+            while running:
+                await self.send_data(writer, await running.popleft())
+        except ValueError as error:
+            # the rest of the payload is skipped so that the next request is read from its start
+            await self.discard(reader, length)
+            await self.send_error(writer, str(error))
+            return
+        finally:
+            for task in running:
+                task.cancel()
+
+        writer.write(pack(RESPONSE_FORMAT, END, 0))
+        await writer.drain()
+
+    async def read_data_block(self, reader, length):
+        '''
+            Reads the next block of data to compress, of at most block_size bytes out of the length left in the payload
+        '''
+        return await reader.readexactly(min(self.block_size, length))
+
+    async def read_encoded_block(self, reader, length):
+        '''
+            Reads the next encoded block to decompress, of at most the length left in the payload.
+            A truncated block is read as it is, for decode_block to reject
+        '''
+        header = await reader.readexactly(min(BLOCK_HEADER_SIZE, length))
+        if len(header) < BLOCK_HEADER_SIZE:
+            return header
+        encoded_length = unpack(BLOCK_HEADER_FORMAT, header)[3]
+        return header + await reader.readexactly(min(encoded_length, length - BLOCK_HEADER_SIZE))
+
+    async def discard(self, reader, length):
+        '''
+            Skips the length bytes left in the payload, a block at a time
+        '''
+        while length:
+            length -= len(await reader.readexactly(min(self.block_size, length)))
+
+    async def send_data(self, writer, data):
+        writer.write(pack(RESPONSE_FORMAT, DATA, len(data)))
+        writer.write(data)
+        await writer.drain()
+
+    async def send_error(self, writer, message):
+        message = message.encode()
+        writer.write(pack(RESPONSE_FORMAT, ERROR, len(message)) + message)
+        await writer.drain()
+
+async def serve(host='127.0.0.1', port=DEFAULT_PORT, path=None, workers=None, block_size=BLOCK_SIZE, started=None):
+    '''
+        Runs the service until it is cancelled
+
+        Parameters:
+            host: address to listen on
+            port: TCP port to listen on, 0 for any free port
+            path: path of a Unix socket to listen on instead of TCP
+            workers: number of worker processes, all the CPUs by default
+            block_size: number of bytes per compressed block
+            started: optional future set to the listening server once it accepts connections
+
+        Return:
+            None
+    '''
+    service = CompressionService(workers, block_size)
+    await service.start()
+    try:
+        if path is not None:
+            server = await asyncio.start_unix_server(service.handle, path)
+        else:
+            server = await asyncio.start_server(service.handle, host, port)
+        async with server:
+            if started is not None:
+                started.set_result(server)
+            await server.serve_forever()
+    finally:
+        await service.close()
+
+async def stream_response(reader):
+    '''
+        Reads the response to a request
+
+        Parameters:
+            reader: asyncio stream reader of the connection
+
+        Return:
+            An asynchronous generator of the blocks of the response, raising ValueError on an error response
+    '''
+    while True:
+        status, length = unpack(RESPONSE_FORMAT, await reader.readexactly(RESPONSE_SIZE))
+        data = await reader.readexactly(length)
+        if status == END:
+            return
+        if status == ERROR:
+            raise ValueError(data.decode())
+        yield data
+
+class ServiceClient:
+    '''
+        Client of the service over a single connection
+    '''
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def connect(cls, host='127.0.0.1', port=DEFAULT_PORT, path=None):
+        if path is not None:
+            return cls(*await asyncio.open_unix_connection(path))
+        return cls(*await asyncio.open_connection(host, port))
+
+    async def request(self, operation, data, codec='huffman', parameter=0):
+        '''
+            Sends a request and gathers its response
+
+            Parameters:
+                operation: COMPRESS or DECOMPRESS
+                data: the payload
+                codec: 'huffman', 'lzw', 'arithmetic', 'lzss', 'bwt', 'stored' or 'auto', only used to compress
+                parameter: the codec parameter, see Block_Encoding.BLOCK_HEADER_FORMAT
+
+            Return:
+                The response
+        '''
+        self.writer.write(pack(REQUEST_FORMAT, operation, CODECS[codec], parameter, len(data)))
+        self.writer.write(data)
+        await self.writer.drain()
+        return b''.join([block async for block in stream_response(self.reader)])
+
+    async def compress(self, data, codec='huffman', parameter=0):
+        return await self.request(COMPRESS, data, codec, parameter)
+
+    async def decompress(self, data):
+        return await self.request(DECOMPRESS, data)
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve compress and decompress requests")
+    parser.add_argument('--host', default='127.0.0.1', help="address to listen on")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help="TCP port to listen on")
+    parser.add_argument('--unix', help="path of a Unix socket to listen on instead of TCP")
+    parser.add_argument('--workers', type=int, help="number of worker processes, all the CPUs by default")
+    parser.add_argument('--block-size', type=int, default=BLOCK_SIZE, help="number of bytes per compressed block")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(serve(args.host, args.port, args.unix, args.workers, args.block_size))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,245 @@
+import logging
+from bisect import bisect_right
+from itertools import islice
+from os.path import getsize
+from struct import calcsize, pack, unpack
+from timeit import default_timer as timer
+from zlib import crc32
+
+from Block_Encoding import BLOCK_SIZE, CODECS, CODEC_NAMES, decode_block, encode_block, map_in_order, read_encoded_blocks
+from Instrumentation import phase
+from Stream_IO import first_mismatch, read_blocks
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'CMPR'
+VERSION = 1
+
+# The file header holds the magic bytes, the format version, the codec id, the codec parameter and the block size
+FILE_HEADER_FORMAT = '>4sBBBI'
+FILE_HEADER_SIZE = calcsize(FILE_HEADER_FORMAT)
+
+# The blocks (see Block_Encoding) are followed by an index with one entry per block: its offset in the file and its
+# original length
+INDEX_ENTRY_FORMAT = '>QI'
+INDEX_ENTRY_SIZE = calcsize(INDEX_ENTRY_FORMAT)
+
+# The footer closes the file with the offset of the index, the number of blocks, the original size, the CRC32 of
+# the whole original and the magic bytes again, so that the index is found by seeking from the end of the file
+FOOTER_FORMAT = '>QQQI4s'
+FOOTER_SIZE = calcsize(FOOTER_FORMAT)
+
+def encode_file(file_to_be_encoded, encoded_file, codec='huffman', parameter=0, block_size=BLOCK_SIZE, workers=1):
+    '''
+        Encodes a file into a container which can be decoded without any other state
+
+        Parameters:
+            file_to_be_encoded: name of the file to be encoded
+            encoded_file: name of the container file
+            codec: 'huffman', 'lzw', 'arithmetic', 'lzss', 'bwt', 'stored' or 'auto'
+            parameter: the codec parameter, see Block_Encoding.BLOCK_HEADER_FORMAT
+            block_size: number of bytes per block
+            workers: number of worker processes, 1 encodes in the calling process
+
+        Return:
+            Number of blocks
+    '''
+    if codec not in CODECS:
+        raise ValueError("unknown codec: {}".format(codec))
+
+    index = []
+    original_size = 0
+    checksum = 0
+    with open(file_to_be_encoded, "rb") as f, open(encoded_file, "wb") as out:
+        out.write(pack(FILE_HEADER_FORMAT, MAGIC, VERSION, CODECS[codec], parameter, block_size))
+
+        def blocks():
+            nonlocal original_size, checksum
+            for block in read_blocks(f, block_size):
+                original_size += len(block)
+                checksum = crc32(block, checksum)
+                index.append(len(block))
+                yield codec, block, parameter
+
+        offset = FILE_HEADER_SIZE
+        for number, encoded_block in enumerate(map_in_order(encode_block, blocks(), workers)):
+            index[number] = (offset, index[number])
+            out.write(encoded_block)
+            offset += len(encoded_block)
+
+        for block_offset, length in index:
+            out.write(pack(INDEX_ENTRY_FORMAT, block_offset, length))
+        out.write(pack(FOOTER_FORMAT, offset, len(index), original_size, checksum, MAGIC))
+
+    return len(index)
+
+class ContainerReader:
+    '''
+        Random access to the data of a container, only the blocks overlapping the requested range get decoded
+    '''
+    def __init__(self, encoded_file):
+        self.file = open(encoded_file, "rb")
+        try:
+            self.read_index()
+        except BaseException:
+            self.file.close()
+            raise
+
+    def read_index(self):
+        '''
+            Checks the header and the footer of the container and reads its index of blocks
+        '''
+        magic, version, codec_id, self.parameter, self.block_size = unpack(FILE_HEADER_FORMAT, self.file.read(FILE_HEADER_SIZE))
+        if magic != MAGIC:
+            raise ValueError("not a container file")
+        if version != VERSION:
+            raise ValueError("unsupported container version: {}".format(version))
+        self.codec = CODEC_NAMES.get(codec_id)
+
+        self.file.seek(-FOOTER_SIZE, 2)
+        index_offset, block_count, self.original_size, self.checksum, magic = unpack(FOOTER_FORMAT, self.file.read(FOOTER_SIZE))
+        if magic != MAGIC:
+            raise ValueError("truncated container file")
+
+        self.file.seek(index_offset)
+        index = self.file.read(block_count * INDEX_ENTRY_SIZE)
+        self.block_offsets = []
+        # original offset of the first byte of every block
+        self.block_starts = []
+        start = 0
+        for i in range(block_count):
+            block_offset, length = unpack(INDEX_ENTRY_FORMAT, index[i * INDEX_ENTRY_SIZE:(i + 1) * INDEX_ENTRY_SIZE])
+            self.block_offsets.append(block_offset)
+            self.block_starts.append(start)
+            start += length
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.file.close()
+
+    def read_block(self, block_number):
+        '''
+            Decodes a single block
+
+            Parameters:
+                block_number: index of the block, starting at 0
+
+            Return:
+                The bytes of the block
+        '''
+        self.file.seek(self.block_offsets[block_number])
+        return decode_block(next(read_encoded_blocks(self.file)))
+
+    def blocks(self):
+        '''
+            Reads the encoded blocks in order
+
+            Return:
+                An iterator of the encoded blocks, headers included
+        '''
+        self.file.seek(FILE_HEADER_SIZE)
+        return islice(read_encoded_blocks(self.file), len(self.block_offsets))
+
+    def read_range(self, offset, length):
+        '''
+            Reads a range of the original data
+
+            Parameters:
+                offset: offset of the first byte in the original data
+                length: number of bytes
+
+            Return:
+                The bytes of the range, fewer than length at the end of the data
+        '''
+        end = min(offset + length, self.original_size)
+        if offset < 0 or length < 0:
+            raise ValueError("negative offset or length")
+        if offset >= end:
+            return b''
+
+        first = bisect_right(self.block_starts, offset) - 1
+        last = bisect_right(self.block_starts, end - 1) - 1
+        data = b''.join(self.read_block(i) for i in range(first, last + 1))
+        start = offset - self.block_starts[first]
+        return data[start:start + end - offset]
+
+def read_range(encoded_file, offset, length):
+    '''
+        Reads a range of the original data of a container
+
+        Parameters:
+            encoded_file: name of the container file
+            offset: offset of the first byte in the original data
+            length: number of bytes
+
+        Return:
+            The bytes of the range
+    '''
+    with ContainerReader(encoded_file) as reader:
+        return reader.read_range(offset, length)
+
+def decode_file(encoded_file, decode_to_file, workers=1):
+    '''
+        Decodes a container, checking the whole output against the CRC32 stored in the footer
+
+        Parameters:
+            encoded_file: name of the container file
+            decode_to_file: name of the file used while writing the decoded output
+            workers: number of worker processes, 1 decodes in the calling process
+
+        Return:
+            None
+    '''
+    with ContainerReader(encoded_file) as reader, open(decode_to_file, "wb") as out:
+        size = 0
+        checksum = 0
+        blocks = ((encoded_block, ) for encoded_block in reader.blocks())
+        for data in map_in_order(decode_block, blocks, workers):
+            size += len(data)
+            checksum = crc32(data, checksum)
+            out.write(data)
+
+        if size != reader.original_size or checksum != reader.checksum:
+            raise ValueError("corrupted container")
+
+def do_Container_Encoding(file_to_be_encoded, codec='huffman', parameter=0):
+    """
+    Driver function for the container format
+
+    Parameters:
+        file_to_be_encoded: name of the file to be encoded
+        codec: 'huffman', 'lzw', 'arithmetic', 'lzss', 'bwt', 'stored' or 'auto'
+        parameter: the codec parameter, see Block_Encoding.BLOCK_HEADER_FORMAT
+
+    Return:
+        Original file size in kB, Encoded file size in kB, Time taken for encoding, Time taken for decoding
+    """
+    name = file_to_be_encoded.split('/')[-1].split('.')[0]
+    encoded_file = "./Encoded_Files/" + name + "_" + codec + "_container"
+    decode_to_file = "./Decoded_Files/" + name + "_" + codec + "_container_decoded"
+
+    start = timer()
+    encode_file(file_to_be_encoded, encoded_file, codec, parameter)
+    end = timer()
+
+    enc_time = end - start
+
+    start = timer()
+    decode_file(encoded_file, decode_to_file)
+    end = timer()
+
+    dec_time = end - start
+
+    with phase('container', 'verify'):
+        offset = first_mismatch(file_to_be_encoded, decode_to_file)
+    if offset is None:
+        logger.info("Original and Decoded file MATCH!")
+    else:
+        logger.warning("Original and Decoded file DO NOT MATCH from byte %d", offset)
+
+    return (getsize(file_to_be_encoded)/1024, getsize(encoded_file)/1024, enc_time, dec_time)
@@ -1,6 +1,22 @@
 import os
+import re
+import heapq
+import logging
+from collections import Counter
+from itertools import islice
 from timeit import default_timer as timer
-from math import ceil
+from struct import calcsize, pack, unpack_from
+
+try:
+    import numpy as np
+except ImportError:
+    # the pure Python paths are used instead
+    np = None
+
+from Instrumentation import phase, report
+from Stream_IO import StreamChecksum, first_mismatch, frame_blocks, map_blocks, read_frames, write_blocks
+
+logger = logging.getLogger(__name__)
 
 # class for the Huffman Tree Node
 class Node:
@@ -8,7 +24,7 @@ class Node:
         # probability of symbol
         self.prob = prob
 
-        # symbol
+        # symbol (None for internal nodes)
         self.symbol = symbol
 
         # left node
@@ -20,171 +36,927 @@ class Node:
         # tree direction (0/1)
         self.code = ''
 
-""" A helper function to print the codes of symbols by traveling Huffman Tree"""
-codes = dict()
+# number of bits resolved by a single lookup in the decoding table
+DECODE_TABLE_BITS = 12
+# largest number of states of the decoding state machine, one per proper prefix of the codes, with 256
+# transitions each. Codes needing more states are decoded with the lookup table instead
+FSM_MAX_STATES = 256
+# payloads smaller than this are decoded with the lookup table, which is quicker to build than the state machine
+FSM_MIN_SIZE = 1 << 16
+
+# number of symbols whose codes are gathered at once by the NumPy bit packing
+PACK_CHUNK_SIZE = 1 << 18
+# inputs smaller than this are packed by the pure Python path
+NUMPY_MIN_SIZE = 1 << 12
+
+# header of an encoded file: symbol kind, zero bits padding the last byte, number of symbols
+HEADER_FORMAT = '>BBI'
+HEADER_SIZE = calcsize(HEADER_FORMAT)
+# the header is followed by the code lengths of the symbols. Text and integer symbols take one
+# (symbol value << 8 | code length) entry each
+SYMBOL_FORMAT = '>I'
+SYMBOL_SIZE = calcsize(SYMBOL_FORMAT)
+# byte alphabets of fewer than BYTE_BITMAP_SIZE symbols take a (symbol, code length) byte pair per symbol,
+# larger ones a bitmap of the symbols present followed by their code lengths in symbol order
+BYTE_BITMAP_SIZE = 32
+TEXT_SYMBOLS = 0
+BYTE_SYMBOLS = 1
+INT_SYMBOLS = 2
+# integer symbols have to fit the 24 high bits of their entry
+MAX_INT_SYMBOL = 1 << 24
+
+# adaptive Huffman codes bytes, a new symbol is sent after the NYT code as a raw 9 bit value
+# and the extra value 256 marks the end of the stream
+ADAPTIVE_RAW_BITS = 9
+ADAPTIVE_END_OF_STREAM = 256
+# size of the blocks read from the input and written to the output when streaming
+CHUNK_SIZE = 1 << 16
+# words and the single other bytes between them, joining the tokens gives the data back
+WORD_TOKENS = re.compile(rb'\w+|\W')
+WORD_START = re.compile(rb'\w')
+
 size_before_compression = 0
 size_after_compression = 0
 res = []
 
 """ A helper function to calculate huffman code for a symbol """
-def Calculate_Codes(node, val=''):
+def Calculate_Codes(node, val='', codes=None):
+    if codes is None:
+        codes = dict()
+
     # huffman code for current node
     newVal = val + str(node.code)
 
     if(node.left):
-        Calculate_Codes(node.left, newVal)
+        Calculate_Codes(node.left, newVal, codes)
     if(node.right):
-        Calculate_Codes(node.right, newVal)
+        Calculate_Codes(node.right, newVal, codes)
 
     if(not node.left and not node.right):
         codes[node.symbol] = newVal
          
     return codes        
 
-""" A helper function to calculate the probabilities of symbols in given data"""
+""" A helper function to calculate the code length of every symbol from the Huffman tree """
+def Calculate_Code_Lengths(node):
+    # walk the tree with an explicit stack, deep trees of large alphabets would exceed the recursion limit
+    code_lengths = dict()
+    stack = [(node, 0)]
+    while stack:
+        node, depth = stack.pop()
+        if not node.left and not node.right:
+            # a lone symbol still needs one bit per occurrence
+            code_lengths[node.symbol] = max(depth, 1)
+        else:
+            if node.left:
+                stack.append((node.left, depth + 1))
+            if node.right:
+                stack.append((node.right, depth + 1))
+    return code_lengths
+
+""" A helper function to build the Huffman tree from the symbol probabilities.
+    The two least probable nodes are merged with a heap, so building costs O(n log n) in the alphabet size """
+def Build_Huffman_Tree(symbol_with_probs):
+    # insertion order breaks ties between nodes of the same probability
+    heap = [(prob, order, Node(prob, symbol)) for order, (symbol, prob) in enumerate(symbol_with_probs.items())]
+    heapq.heapify(heap)
+
+    # a single symbol still needs one bit per occurrence
+    if len(heap) == 1:
+        heap[0][2].code = 0
+
+    order = len(heap)
+    while len(heap) > 1:
+        # pick 2 smallest nodes
+        right_prob, _, right = heapq.heappop(heap)
+        left_prob, _, left = heapq.heappop(heap)
+
+        left.code = 0
+        right.code = 1
+
+        # combine the 2 smallest nodes to create new node
+        newNode = Node(left_prob + right_prob, None, left, right)
+        heapq.heappush(heap, (newNode.prob, order, newNode))
+        order += 1
+
+    return heap[0][2]
+
+""" A helper function to calculate code lengths of at most max_code_length bits with the package-merge algorithm.
+    Gives the optimal lengths under that limit, used when the Huffman tree is deeper than allowed """
+def Limit_Code_Lengths(symbol_with_probs, max_code_length):
+    symbols = sorted(symbol_with_probs, key=symbol_with_probs.get)
+    if len(symbols) == 1:
+        return {symbols[0]: 1}
+    if len(symbols) > (1 << max_code_length):
+        raise ValueError("{} symbols cannot be coded in {} bits".format(len(symbols), max_code_length))
+
+    # items are (weight, symbol index, None) for leaves and (weight, None, (item, item)) for packages
+    leaves = [(symbol_with_probs[symbol], index, None) for index, symbol in enumerate(symbols)]
+    items = leaves
+    for _ in range(max_code_length - 1):
+        packages = [(items[i][0] + items[i + 1][0], None, (items[i], items[i + 1]))
+                    for i in range(0, len(items) - 1, 2)]
+        items = list(heapq.merge(leaves, packages, key=lambda x: x[0]))
+
+    # the code length of a symbol is the number of times it appears in the 2n - 2 cheapest items
+    lengths = [0] * len(symbols)
+    stack = items[:2 * len(symbols) - 2]
+    while stack:
+        _, index, children = stack.pop()
+        if children is None:
+            lengths[index] += 1
+        else:
+            stack.extend(children)
+
+    return {symbol: lengths[index] for index, symbol in enumerate(symbols)}
+
+""" A helper function to rebuild a Huffman tree matching the given codes """
+def Build_Tree(coding, symbol_with_probs):
+    root = Node(0, None)
+    for symbol, code in coding.items():
+        prob = symbol_with_probs[symbol]
+        node = root
+        node.prob += prob
+        for bit in code:
+            child = node.left if bit == '0' else node.right
+            if child is None:
+                child = Node(0, None)
+                child.code = int(bit)
+                if bit == '0':
+                    node.left = child
+                else:
+                    node.right = child
+            node = child
+            node.prob += prob
+        node.symbol = symbol
+    return root
+
+""" A helper function to assign canonical Huffman codes from the code lengths.
+    Symbols are ordered by code length then by value and consecutive symbols get consecutive codes,
+    so the lengths alone are enough to rebuild the codes """
+def Calculate_Canonical_Codes(code_lengths):
+    codes = dict()
+    code = 0
+    previous_length = 0
+    for symbol in sorted(code_lengths, key=lambda x: (code_lengths[x], x)):
+        length = code_lengths[symbol]
+        code <<= length - previous_length
+        codes[symbol] = format(code, '0{}b'.format(length))
+        code += 1
+        previous_length = length
+    return codes
+
+""" A helper function to find the kind of symbols of the data: bytes, text characters or integers below MAX_INT_SYMBOL.
+    Raises ValueError for any other symbol, which the header cannot store """
+def Symbol_Kind(data, symbols):
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return BYTE_SYMBOLS
+    if isinstance(data, str):
+        return TEXT_SYMBOLS
+    for symbol in symbols:
+        if not isinstance(symbol, int) or not 0 <= symbol < MAX_INT_SYMBOL:
+            raise ValueError("cannot encode symbol {!r}, only bytes, text and integers below {} are supported".format(symbol, MAX_INT_SYMBOL))
+    return INT_SYMBOLS
+
+""" A helper function to calculate the size in bytes of the header of the given number of symbols """
+def Header_Size(symbol_count, symbol_kind):
+    if symbol_kind == BYTE_SYMBOLS:
+        return HEADER_SIZE + min(2 * symbol_count, BYTE_BITMAP_SIZE + symbol_count)
+    return HEADER_SIZE + SYMBOL_SIZE * symbol_count
+
+""" A helper function to serialize the code lengths into the header of the encoded data """
+def Write_Header(code_lengths, padding, symbol_kind):
+    header = bytearray(pack(HEADER_FORMAT, symbol_kind, padding, len(code_lengths)))
+    symbols = sorted(code_lengths)
+    if symbol_kind == BYTE_SYMBOLS and len(symbols) < BYTE_BITMAP_SIZE:
+        for symbol in symbols:
+            header += bytes((symbol, code_lengths[symbol]))
+    elif symbol_kind == BYTE_SYMBOLS:
+        bitmap = 0
+        for symbol in symbols:
+            bitmap |= 1 << (255 - symbol)
+        header += bitmap.to_bytes(BYTE_BITMAP_SIZE, 'big')
+        header += bytes(code_lengths[symbol] for symbol in symbols)
+    else:
+        for symbol in symbols:
+            value = ord(symbol) if symbol_kind == TEXT_SYMBOLS else symbol
+            header += pack(SYMBOL_FORMAT, (value << 8) | code_lengths[symbol])
+    return bytes(header)
+
+""" A helper function to read the code lengths back from the header of the encoded data.
+    Returns the code lengths, the padding, the symbol kind and the offset of the packed codes """
+def Read_Header(encoded_data):
+    symbol_kind, padding, symbol_count = unpack_from(HEADER_FORMAT, encoded_data)
+    offset = HEADER_SIZE
+    if symbol_kind == BYTE_SYMBOLS and symbol_count < BYTE_BITMAP_SIZE:
+        entries = encoded_data[offset:offset + 2 * symbol_count]
+        return dict(zip(entries[::2], entries[1::2])), padding, symbol_kind, offset + 2 * symbol_count
+    if symbol_kind == BYTE_SYMBOLS:
+        bitmap = int.from_bytes(encoded_data[offset:offset + BYTE_BITMAP_SIZE], 'big')
+        offset += BYTE_BITMAP_SIZE
+        symbols = [symbol for symbol in range(256) if (bitmap >> (255 - symbol)) & 1]
+        if len(symbols) != symbol_count:
+            raise ValueError("corrupted header")
+        return dict(zip(symbols, encoded_data[offset:offset + symbol_count])), padding, symbol_kind, offset + symbol_count
+    if symbol_kind not in (TEXT_SYMBOLS, INT_SYMBOLS):
+        raise ValueError("unknown symbol kind: {}".format(symbol_kind))
+
+    code_lengths = dict()
+    for _ in range(symbol_count):
+        (value,) = unpack_from(SYMBOL_FORMAT, encoded_data, offset)
+        offset += SYMBOL_SIZE
+        symbol = chr(value >> 8) if symbol_kind == TEXT_SYMBOLS else value >> 8
+        code_lengths[symbol] = value & 0xFF
+    return code_lengths, padding, symbol_kind, offset
+
+""" A helper function to calculate the probabilities of symbols in given data.
+    Bytes are counted with a single np.bincount when NumPy is available. The symbols come out sorted either way,
+    so that the ties of Build_Huffman_Tree, and the encoded output, do not depend on NumPy being installed """
 def Calculate_Probability(data):
-    symbols = dict()
-    for element in data:
-        if symbols.get(element) == None:
-            symbols[element] = 1
-        else: 
-            symbols[element] += 1     
-    return symbols
-
-""" A helper function to obtain the encoded output"""
+    if np is not None and isinstance(data, (bytes, bytearray, memoryview)):
+        counts = np.bincount(np.frombuffer(data, np.uint8), minlength=256)
+        return {int(symbol): int(counts[symbol]) for symbol in np.flatnonzero(counts)}
+    return dict(sorted(Counter(data).items()))
+
+""" A helper function to calculate the size in bits of the data once encoded, from the symbol counts and code lengths"""
+def Encoded_Size(symbol_with_probs, code_lengths):
+    return sum(count * code_lengths[symbol] for symbol, count in symbol_with_probs.items())
+
+""" A helper function to obtain the encoded output, packed 8 bits per byte.
+    Also returns the number of zero bits padding the last byte """
 def Output_Encoded(data, coding):
-    encoding_output = []
-    for c in data:
-      #  print(coding[c], end = '')
-        encoding_output.append(coding[c])
-        
-    string = ''.join([str(item) for item in encoding_output])    
-    return string
-        
+    # the NumPy path needs every pair of codes to fit in a 64 bit word, and only pays off its tables on larger inputs
+    if (np is not None and isinstance(data, (bytes, bytearray, memoryview)) and len(data) >= NUMPY_MIN_SIZE
+            and max(map(len, coding.values())) <= 32):
+        return Output_Encoded_NumPy(data, coding)
+
+    bits = ''.join(map(coding.__getitem__, data))
+    padding = -len(bits) % 8
+    bits += '0' * padding
+
+    packed = int(bits, 2).to_bytes(len(bits) // 8, 'big') if bits else b''
+    return packed, padding
+
+""" A helper function to obtain the encoded output of bytes with NumPy.
+    The symbols are taken two at a time, each pair of codes being looked up in a table of 65536 concatenated codes.
+    Every pair code is placed at its bit offset, the cumulative sum of the code lengths, in 64 bit words:
+    the codes starting in the same word are merged with a bitwise or reduction, as are the tails of the codes
+    spilling over the next word. The pairs are handled a chunk at a time, the last partial word carried over """
+def Output_Encoded_NumPy(data, coding):
+    code_table = np.zeros(256, np.uint64)
+    length_table = np.zeros(256, np.uint64)
+    for symbol, code in coding.items():
+        code_table[symbol] = int(code, 2)
+        length_table[symbol] = len(code)
+    pair_codes = ((code_table[:, None] << length_table[None, :]) | code_table[None, :]).ravel()
+    pair_lengths = (length_table[:, None] + length_table[None, :]).ravel()
+
+    data = memoryview(data).cast('B')
+    pairs = np.frombuffer(data[:len(data) & ~1], '>u2')
+    packed = []
+    carry = np.uint64(0)
+    total_bits = 0
+    for start in range(0, len(pairs) + 1, PACK_CHUNK_SIZE):
+        chunk = pairs[start:start + PACK_CHUNK_SIZE]
+        codes = pair_codes[chunk]
+        lengths = pair_lengths[chunk]
+        if start + PACK_CHUNK_SIZE > len(pairs) and len(data) & 1:
+            # the last symbol of an odd length input has no pair
+            codes = np.append(codes, code_table[data[-1]])
+            lengths = np.append(lengths, length_table[data[-1]])
+        if not len(codes):
+            break
+
+        # bit offsets from the start of the partial word carried over
+        ends = np.cumsum(lengths)
+        ends += np.uint64(total_bits & 63)
+        starts = ends - lengths
+        word_index = starts >> np.uint64(6)
+        bit_offset = starts & np.uint64(63)
+
+        # codes left aligned in 64 bits, then split between their first word and the next one,
+        # the tail being zero when the code fits its first word
+        aligned = codes << (np.uint64(64) - lengths)
+        head = aligned >> bit_offset
+        tail = (aligned << (np.uint64(63) - bit_offset)) << np.uint64(1)
+
+        first = np.flatnonzero(np.diff(word_index, prepend=~word_index[:1]))
+        words = np.zeros(int(ends[-1] >> np.uint64(6)) + 2, np.uint64)
+        words[word_index[first]] = np.bitwise_or.reduceat(head, first)
+        words[word_index[first] + np.uint64(1)] |= np.bitwise_or.reduceat(tail, first)
+        words[0] |= carry
+
+        full_words = int(ends[-1] >> np.uint64(6))
+        packed.append(words[:full_words].astype('>u8').tobytes())
+        carry = words[full_words]
+        total_bits += int(lengths.sum())
+
+    # the bits left in the carried word, padded with zeros up to the byte boundary
+    padding = -total_bits % 8
+    packed.append(int(carry).to_bytes(8, 'big')[:((total_bits & 63) + 7) // 8])
+    return b''.join(packed), padding
+
+""" A helper function to build the lookup table used for decoding from the canonical code lengths.
+    Every code of at most table_bits bits fills all the table slots starting with it.
+    Longer codes are resolved bit by bit with the first code and symbol offset of each code length """
+def Build_Decoding_Table(code_lengths, table_bits=DECODE_TABLE_BITS):
+    max_length = max(code_lengths.values())
+    table_bits = min(table_bits, max_length)
+
+    table = [None] * (1 << table_bits)
+    for symbol, code in Calculate_Canonical_Codes(code_lengths).items():
+        length = len(code)
+        if length <= table_bits:
+            shift = table_bits - length
+            start = int(code, 2) << shift
+            entry = (symbol, length)
+            for index in range(start, start + (1 << shift)):
+                table[index] = entry
+
+    # canonical symbol order, and for each length its first code and the index of its first symbol
+    sorted_symbols = sorted(code_lengths, key=lambda x: (code_lengths[x], x))
+    counts = [0] * (max_length + 1)
+    for length in code_lengths.values():
+        counts[length] += 1
+    first_codes = [0] * (max_length + 1)
+    offsets = [0] * (max_length + 1)
+    for length in range(1, max_length + 1):
+        first_codes[length] = (first_codes[length - 1] + counts[length - 1]) << 1
+        offsets[length] = offsets[length - 1] + counts[length - 1]
+
+    return table, table_bits, (sorted_symbols, counts, first_codes, offsets), max_length
+
+""" A helper function to build the state machine decoding a whole input byte per lookup from the canonical code lengths.
+    A state is a proper prefix of the codes, the start state 0 being the empty prefix. For each state and input byte
+    the byte table holds the symbols completed by that byte and the next state, the bit table holds the same for a
+    single bit. Returns None when the codes need more than FSM_MAX_STATES states or leave some bit sequence undecodable """
+def Build_Decoding_FSM(code_lengths, symbol_kind=BYTE_SYMBOLS):
+    # a complete code over n symbols has exactly n - 1 proper prefixes, so the states are counted before building them
+    if len(code_lengths) - 1 > FSM_MAX_STATES:
+        return None
+    max_length = max(code_lengths.values())
+    if sum(1 << (max_length - length) for length in code_lengths.values()) != 1 << max_length:
+        return None
+
+    codes = Calculate_Canonical_Codes(code_lengths)
+    states = {'': 0}
+    for code in codes.values():
+        for length in range(1, len(code)):
+            states.setdefault(code[:length], len(states))
+
+    # symbols are emitted as bytes objects or tuples, to be appended to a bytearray or a list
+    symbols_of = {code: symbol for symbol, code in codes.items()}
+    if symbol_kind == BYTE_SYMBOLS:
+        emit = lambda symbol: bytes((symbol, ))
+        empty = b''
+    else:
+        emit = lambda symbol: (symbol, )
+        empty = ()
+
+    bit_steps = [None] * (2 * len(states))
+    for prefix, state in states.items():
+        for bit in (0, 1):
+            following = prefix + str(bit)
+            if following in symbols_of:
+                bit_steps[2 * state + bit] = (emit(symbols_of[following]), 0)
+            else:
+                bit_steps[2 * state + bit] = (empty, states[following])
+
+    # a byte is walked as two nibbles, each one walked bit by bit
+    nibble_steps = [Walk_Bits(bit_steps, state, nibble, 4, empty) for state in range(len(states)) for nibble in range(16)]
+    byte_steps = []
+    for state in range(len(states)):
+        for high in range(16):
+            high_symbols, high_state = nibble_steps[state << 4 | high]
+            for low in range(16):
+                low_symbols, low_state = nibble_steps[high_state << 4 | low]
+                byte_steps.append((high_symbols + low_symbols, low_state))
+    return byte_steps, bit_steps, empty
+
+""" A helper function to follow the bit table of the decoding state machine over the bit_count low bits of value,
+    most significant first. Returns the symbols emitted and the state reached """
+def Walk_Bits(bit_steps, state, value, bit_count, emitted):
+    for shift in range(bit_count - 1, -1, -1):
+        symbols, state = bit_steps[2 * state + ((value >> shift) & 1)]
+        emitted += symbols
+    return emitted, state
+
 """ A helper function to calculate the space difference between compressed and non compressed data"""    
-def Total_Gain(data, coding):
+def Total_Gain(data, coding, symbol_with_probs=None):
     global size_before_compression, size_after_compression
 
     before_compression = len(data) * 8 # total bit space to stor the data before compression
-    after_compression = 0
-    symbols = coding.keys()
-    for symbol in symbols:
-        count = data.count(symbol)
-        after_compression += count * len(coding[symbol]) #calculate how many bit is required for that symbol in total
+    # bits required for every symbol in total, from the symbol counts rather than a scan of the data per symbol
+    if symbol_with_probs is None:
+        symbol_with_probs = Calculate_Probability(data)
+    after_compression = Encoded_Size(symbol_with_probs, {symbol: len(code) for symbol, code in coding.items()})
     size_before_compression = before_compression
     size_after_compression = after_compression         
-    print("Space usage before compression (in bits):", size_before_compression)    
-    print("Space usage after compression (in bits):",  size_after_compression)
-    print("Compression ratio  = ", before_compression / after_compression)
+    logger.info("Space usage before compression (in bits): %d", size_before_compression)
+    logger.info("Space usage after compression (in bits): %d", size_after_compression)
+    logger.info("Compression ratio = %f", before_compression / after_compression)
+
+""" A helper function to build the Huffman codes from the symbol probabilities.
+    Returns the code lengths, the canonical codes and the Huffman tree """
+def Build_Codes(symbol_with_probs, max_code_length=None):
+    tree = Build_Huffman_Tree(symbol_with_probs)
+
+    # only the code lengths are kept from the tree, the codes themselves are canonical
+    code_lengths = Calculate_Code_Lengths(tree)
+    huffman_encoding = Calculate_Canonical_Codes(code_lengths)
+    if max_code_length is not None and max(code_lengths.values()) > max_code_length:
+        code_lengths = Limit_Code_Lengths(symbol_with_probs, max_code_length)
+        huffman_encoding = Calculate_Canonical_Codes(code_lengths)
+        tree = Build_Tree(huffman_encoding, symbol_with_probs)
+    return code_lengths, huffman_encoding, tree
+
+"""A helper function to encoding the data using Huffman encoding.
+   max_code_length optionally bounds the length of the codes, and so the size of the decoding tables"""
+def Huffman_Encoding(data, max_code_length=None):
+    # the symbols of any bytes-like data are its bytes, whatever the format of the view
+    if isinstance(data, memoryview):
+        data = data.cast('B')
 
-"""A helper function to encoding the data using Huffman encoding"""
-def Huffman_Encoding(data):
     # calculate probability of each symbol
     symbol_with_probs = Calculate_Probability(data)
 
     # separate symbols and their probabilities
     symbols = symbol_with_probs.keys()
     probabilities = symbol_with_probs.values()
-    print("symbols: ", symbols)
-    print("probabilities: ", probabilities)
-    
-    nodes = []
+    logger.debug("symbols: %s", symbols)
+    logger.debug("probabilities: %s", probabilities)
     
-    # converting symbols and probabilities into huffman tree nodes
-    for symbol in symbols:
-        nodes.append(Node(symbol_with_probs.get(symbol), symbol))
-    
-    while len(nodes) > 1:
-        # sort all the nodes in ascending order based on their probability
-        nodes = sorted(nodes, key=lambda x: x.prob)
-        # for node in nodes:  
-        #      print(node.symbol, node.prob)
-    
-        # pick 2 smallest nodes
-        right = nodes[0]
-        left = nodes[1]
-    
-        left.code = 0
-        right.code = 1
-    
-        # combine the 2 smallest nodes to create new node
-        newNode = Node(left.prob+right.prob, left.symbol+right.symbol, left, right)
-    
-        nodes.remove(left)
-        nodes.remove(right)
-        nodes.append(newNode)
-            
-    huffman_encoding = Calculate_Codes(nodes[0])
-    print("symbols with codes", huffman_encoding)
+    symbol_kind = Symbol_Kind(data, symbols)
+    if not symbol_with_probs:
+        return Write_Header(dict(), 0, symbol_kind), None
 
-    # compute metrics
-    Total_Gain(data, huffman_encoding)
+    code_lengths, huffman_encoding, tree = Build_Codes(symbol_with_probs, max_code_length)
+    logger.debug("symbols with codes %s", huffman_encoding)
+
+    # compute metrics, integer symbols having no size of their own to compare against
+    if symbol_kind != INT_SYMBOLS and logger.isEnabledFor(logging.INFO):
+        Total_Gain(data, huffman_encoding, symbol_with_probs)
 
     # convert orignal text into encoded text using symbol encoding generated
-    encoded_output = Output_Encoded(data,huffman_encoding)
-    return encoded_output, nodes[0]  
+    encoded_output, padding = Output_Encoded(data,huffman_encoding)
+    return Write_Header(code_lengths, padding, symbol_kind) + encoded_output, tree
     
-"""A helper function to decode the data using Huffman tree"""
-def Huffman_Decoding(encoded_data, huffman_tree):
-    tree_head = huffman_tree
-    decoded_output = []
-    for x in encoded_data:
-        # move left or right depending on the bit the encoding of a symbol, if 1 move right, if 0 move left
-        if x == '1':
-            huffman_tree = huffman_tree.right   
-        elif x == '0':
-            huffman_tree = huffman_tree.left
-        # catch exception and edge cases
-        try:
-            if huffman_tree.left.symbol == None and huffman_tree.right.symbol == None:
-                pass
-        except AttributeError:
-            decoded_output.append(huffman_tree.symbol)
-            huffman_tree = tree_head
-        
-    # return the decoded string
-    string = ''.join([str(item) for item in decoded_output])
-    return string        
-
-""" The driver function for Huffman Encoding algorithm """
+"""A helper function to decode the data using the code lengths stored in its header"""
+def Huffman_Decoding(encoded_data):
+    code_lengths, padding, symbol_kind, offset = Read_Header(encoded_data)
+    if not code_lengths:
+        return Join_Symbols([], symbol_kind)
+
+    # only large payloads pay off the state machine, the lookup table handles the rest and the codes it cannot serve
+    if len(encoded_data) - offset >= FSM_MIN_SIZE:
+        with phase('huffman', 'fsm', symbols=len(code_lengths)) as fsm_phase:
+            decoding_fsm = Build_Decoding_FSM(code_lengths, symbol_kind)
+            fsm_phase.add(states=len(decoding_fsm[1]) // 2 if decoding_fsm else 0)
+        if decoding_fsm is not None:
+            return Decode_Payload_FSM(encoded_data, offset, padding, symbol_kind, decoding_fsm)
+
+    with phase('huffman', 'table', symbols=len(code_lengths)) as table_phase:
+        decoding_table = Build_Decoding_Table(code_lengths)
+        table_phase.add(table_size=len(decoding_table[0]), max_code_length=decoding_table[3])
+    return Decode_Payload(encoded_data, offset, padding, symbol_kind, decoding_table)
+
+"""A helper function to turn the decoded symbols back into the type of the encoded data:
+   a string for text, bytes for bytes and a list for integers"""
+def Join_Symbols(decoded_output, symbol_kind):
+    if symbol_kind == TEXT_SYMBOLS:
+        return ''.join(decoded_output)
+    if symbol_kind == BYTE_SYMBOLS:
+        return bytes(decoded_output)
+    return list(decoded_output)
+
+"""A helper function to decode the encoded bits starting at offset with a table returned by Build_Decoding_Table,
+   so that one table serves any number of payloads encoded with the same codes"""
+def Decode_Payload(encoded_data, offset, padding, symbol_kind, decoding_table):
+    table, table_bits, canonical, max_length = decoding_table
+    with phase('huffman', 'decode', encoded_bytes=len(encoded_data)) as decode_phase:
+        sorted_symbols, counts, first_codes, offsets = canonical
+        mask = (1 << table_bits) - 1
+
+        total_bits = (len(encoded_data) - offset) * 8 - padding
+        # trailing zero bytes let the last lookups peek a full table index
+        payload = bytes(encoded_data[offset:]) + bytes((max_length + 7) // 8)
+
+        decoded_output = []
+        append = decoded_output.append
+        bit_buffer = 0
+        buffered_bits = 0
+        consumed_bits = 0
+        position = 0
+        while consumed_bits < total_bits:
+            # refill the bit buffer a byte at a time
+            while buffered_bits < table_bits:
+                bit_buffer = (bit_buffer << 8) | payload[position]
+                position += 1
+                buffered_bits += 8
+
+            entry = table[(bit_buffer >> (buffered_bits - table_bits)) & mask]
+            if entry is not None:
+                symbol, length = entry
+            else:
+                # code longer than the table index, extend it one bit at a time
+                # until it falls in the range of canonical codes of that length
+                length = table_bits
+                while True:
+                    length += 1
+                    while buffered_bits < length:
+                        bit_buffer = (bit_buffer << 8) | payload[position]
+                        position += 1
+                        buffered_bits += 8
+                    index = (bit_buffer >> (buffered_bits - length)) - first_codes[length]
+                    if index < counts[length]:
+                        break
+                symbol = sorted_symbols[offsets[length] + index]
+
+            append(symbol)
+            buffered_bits -= length
+            consumed_bits += length
+            bit_buffer &= (1 << buffered_bits) - 1
+
+        decode_phase.add(decoded_bytes=len(decoded_output))
+
+    return Join_Symbols(decoded_output, symbol_kind)
+
+"""A helper function to decode the encoded bits starting at offset with a state machine returned by Build_Decoding_FSM,
+   one lookup per byte. The last byte is walked bit by bit so that its padding bits emit nothing"""
+def Decode_Payload_FSM(encoded_data, offset, padding, symbol_kind, decoding_fsm):
+    byte_steps, bit_steps, empty = decoding_fsm
+    with phase('huffman', 'decode', encoded_bytes=len(encoded_data)) as decode_phase:
+        payload = memoryview(encoded_data)[offset:]
+        decoded_output = bytearray() if symbol_kind == BYTE_SYMBOLS else []
+        state = 0
+        for byte in payload[:-1]:
+            symbols, state = byte_steps[state << 8 | byte]
+            decoded_output += symbols
+        if payload:
+            symbols, state = Walk_Bits(bit_steps, state, payload[-1] >> padding, 8 - padding, empty)
+            decoded_output += symbols
+
+        decode_phase.add(decoded_bytes=len(decoded_output))
+
+    return Join_Symbols(decoded_output, symbol_kind)
+
+"""A helper function to encode a block of bytes with its own header, without printing any metrics.
+   The result is decoded by Huffman_Decoding"""
+def Huffman_Encode_Block(data, max_code_length=None):
+    with phase('huffman', 'model', data_bytes=len(data)) as model_phase:
+        symbol_with_probs = Calculate_Probability(data)
+        model_phase.add(symbols=len(symbol_with_probs))
+    if not symbol_with_probs:
+        return Write_Header(dict(), 0, BYTE_SYMBOLS)
+
+    with phase('huffman', 'tree') as tree_phase:
+        code_lengths, huffman_encoding, _ = Build_Codes(symbol_with_probs, max_code_length)
+        tree_phase.add(max_code_length=max(code_lengths.values()))
+    with phase('huffman', 'encode', data_bytes=len(data)) as encode_phase:
+        encoded_output, padding = Output_Encoded(data, huffman_encoding)
+        encode_phase.add(encoded_bytes=len(encoded_output))
+    return Write_Header(code_lengths, padding, BYTE_SYMBOLS) + encoded_output
+
+"""A helper function to encode a stream of bytes block by block.
+   Every block gets its own codes and header and is prefixed with its encoded length,
+   so only one block is held in memory at a time"""
+def Huffman_Encoding_Stream(data_blocks, max_code_length=None):
+    return frame_blocks(Huffman_Encode_Block(block, max_code_length) for block in data_blocks if block)
+
+"""A helper function to decode a stream encoded by Huffman_Encoding_Stream, block by block"""
+def Huffman_Decoding_Stream(encoded_chunks):
+    for encoded_block in read_frames(encoded_chunks):
+        yield Huffman_Decoding(encoded_block)
+
+# class for the adaptive (FGK) Huffman tree, updated after every symbol
+class AdaptiveHuffmanTree:
+    def __init__(self):
+        max_nodes = 2 * (ADAPTIVE_END_OF_STREAM + 1) + 1
+
+        # nodes are indices into these lists, None marks a missing child and -1 an internal node
+        self.weight = [0]
+        self.parent = [None]
+        self.left = [None]
+        self.right = [None]
+        self.symbol = [-1]
+
+        # sibling property numbering: weights never decrease with the number and the root has the highest
+        self.number = [max_nodes - 1]
+        self.order = [None] * max_nodes
+        self.order[max_nodes - 1] = 0
+
+        # the tree starts as a lone NYT (not yet transmitted) node
+        self.root = 0
+        self.nyt = 0
+        self.leaves = dict()
+
+    def add_node(self, parent, symbol):
+        node = len(self.weight)
+        self.weight.append(0)
+        self.parent.append(parent)
+        self.left.append(None)
+        self.right.append(None)
+        self.symbol.append(symbol)
+        self.number.append(None)
+        return node
+
+    def code(self, node):
+        # walk up to the root, a right branch is a 1 bit
+        code = 0
+        length = 0
+        while node != self.root:
+            parent = self.parent[node]
+            if self.right[parent] == node:
+                code |= 1 << length
+            length += 1
+            node = parent
+        return code, length
+
+    def swap(self, first, second):
+        first_parent = self.parent[first]
+        second_parent = self.parent[second]
+        if first_parent == second_parent:
+            self.left[first_parent], self.right[first_parent] = self.right[first_parent], self.left[first_parent]
+        else:
+            if self.left[first_parent] == first:
+                self.left[first_parent] = second
+            else:
+                self.right[first_parent] = second
+            if self.left[second_parent] == second:
+                self.left[second_parent] = first
+            else:
+                self.right[second_parent] = first
+            self.parent[first], self.parent[second] = second_parent, first_parent
+
+        first_number = self.number[first]
+        second_number = self.number[second]
+        self.number[first], self.number[second] = second_number, first_number
+        self.order[second_number] = first
+        self.order[first_number] = second
+
+    def update(self, symbol):
+        node = self.leaves.get(symbol)
+        if node is None:
+            # split the NYT node into a new NYT node and a leaf for the symbol
+            parent = self.nyt
+            number = self.number[parent]
+            self.nyt = self.add_node(parent, -1)
+            node = self.add_node(parent, symbol)
+            self.left[parent] = self.nyt
+            self.right[parent] = node
+            self.number[node] = number - 1
+            self.number[self.nyt] = number - 2
+            self.order[number - 1] = node
+            self.order[number - 2] = self.nyt
+            self.leaves[symbol] = node
+
+        while node is not None:
+            # move the node to the highest number of its weight block before incrementing it
+            weight = self.weight[node]
+            leader_number = self.number[node]
+            while leader_number + 1 < len(self.order) and self.weight[self.order[leader_number + 1]] == weight:
+                leader_number += 1
+            leader = self.order[leader_number]
+            if leader != node and leader != self.parent[node] and leader != self.root:
+                self.swap(node, leader)
+
+            self.weight[node] += 1
+            node = self.parent[node]
+
+"""A helper function to encode a stream of bytes in a single pass with adaptive Huffman coding.
+   Takes an iterable of byte strings and generates the encoded bytes"""
+def Adaptive_Huffman_Encoding(data_chunks):
+    tree = AdaptiveHuffmanTree()
+    output = bytearray()
+    bit_buffer = 0
+    buffered_bits = 0
+
+    for chunk in data_chunks:
+        for symbol in chunk:
+            node = tree.leaves.get(symbol)
+            if node is not None:
+                code, length = tree.code(node)
+            else:
+                code, length = tree.code(tree.nyt)
+                code = (code << ADAPTIVE_RAW_BITS) | symbol
+                length += ADAPTIVE_RAW_BITS
+            tree.update(symbol)
+
+            bit_buffer = (bit_buffer << length) | code
+            buffered_bits += length
+            while buffered_bits >= 8:
+                buffered_bits -= 8
+                output.append(bit_buffer >> buffered_bits)
+                bit_buffer &= (1 << buffered_bits) - 1
+
+        if len(output) >= CHUNK_SIZE:
+            yield bytes(output)
+            output = bytearray()
+
+    # end of stream marker, then zero bits up to the byte boundary
+    code, length = tree.code(tree.nyt)
+    bit_buffer = (bit_buffer << (length + ADAPTIVE_RAW_BITS)) | (code << ADAPTIVE_RAW_BITS) | ADAPTIVE_END_OF_STREAM
+    buffered_bits += length + ADAPTIVE_RAW_BITS
+    padding = -buffered_bits % 8
+    output.extend((bit_buffer << padding).to_bytes((buffered_bits + padding) // 8, 'big'))
+    report('adaptive huffman', 'encode', symbols=len(tree.leaves))
+    yield bytes(output)
+
+"""A helper function to decode a stream encoded by Adaptive_Huffman_Encoding.
+   Takes an iterable of encoded byte strings and generates the decoded bytes"""
+def Adaptive_Huffman_Decoding(encoded_chunks):
+    tree = AdaptiveHuffmanTree()
+    output = bytearray()
+
+    def bits():
+        for chunk in encoded_chunks:
+            for byte in chunk:
+                for shift in range(7, -1, -1):
+                    yield (byte >> shift) & 1
+    bit_stream = bits()
+
+    while True:
+        # move left or right from the root until a leaf or the NYT node is reached
+        node = tree.root
+        while tree.left[node] is not None:
+            bit = next(bit_stream, None)
+            if bit is None:
+                raise ValueError("truncated stream")
+            node = tree.right[node] if bit else tree.left[node]
+
+        if node == tree.nyt:
+            symbol = 0
+            for _ in range(ADAPTIVE_RAW_BITS):
+                bit = next(bit_stream, None)
+                if bit is None:
+                    raise ValueError("truncated stream")
+                symbol = (symbol << 1) | bit
+            if symbol == ADAPTIVE_END_OF_STREAM:
+                break
+        else:
+            symbol = tree.symbol[node]
+        tree.update(symbol)
+
+        output.append(symbol)
+        if len(output) >= CHUNK_SIZE:
+            yield bytes(output)
+            output = bytearray()
+
+    yield bytes(output)
+
+""" The driver function for Huffman Encoding algorithm.
+    The file is streamed block by block, so its size is not bounded by memory """
 def doHuffman(file_name):
     
     datasize = os.path.getsize(file_name)
 
-    # open the input file passed
-    with open(file_name, "r") as f:
-        data_content = f.read()
+    enc_msg_file = "./Encoded_Files/" + file_name.split('/')[-1].split('.')[0] + "_Huffman_encoded"
+    decode_to_file = "./Decoded_Files/" + file_name.split('/')[-1].split('.')[0] + "_Huffman_decoded"
+
+    original_checksum = StreamChecksum()
+    decoded_checksum = StreamChecksum()
 
     # start and end timers for encoding
     start = timer()
-    encoding, tree = Huffman_Encoding(data_content)
+    with open(file_name, "rb") as f, open(enc_msg_file, "wb") as out:
+        write_blocks(Huffman_Encoding_Stream(original_checksum.update(map_blocks(f))), out)
     end = timer()
     encode_time = end - start
 
-    enc_msg_file = "./Encoded_Files/" + file_name.split('/')[-1].split('.')[0] + "_Huffman_encoded"
-    with open(enc_msg_file, "w+") as f:
-        f.write(encoding)
+    # start and end timers for decoding
+    start = timer()
+    with open(enc_msg_file, "rb") as f, open(decode_to_file, "wb") as out:
+        write_blocks(decoded_checksum.update(Huffman_Decoding_Stream(map_blocks(f))), out)
+    end = timer()
+    decode_time = end - start
+
+    # check if orignal text and decoded output matches
+    with phase('huffman', 'verify'):
+        offset = None if original_checksum.matches(decoded_checksum) else first_mismatch(file_name, decode_to_file)
+    if offset is None:
+        logger.info("Original and Decoded file MATCH")
+    else:
+        logger.warning("Original and Decoded file DO NOT MATCH from byte %d", offset)
+
+    logger.info("data size = %d", datasize)
+    logger.info("Encoding Time = %f", encode_time)
+    logger.info("Decoding Time = %f", decode_time)
+
+    # return the metrics
+    return datasize/1024, os.path.getsize(enc_msg_file)/1024, encode_time, decode_time
+
+""" The driver function for adaptive Huffman Encoding, reading the input only once """
+def doAdaptiveHuffman(file_name):
+
+    datasize = os.path.getsize(file_name)
+
+    enc_msg_file = "./Encoded_Files/" + file_name.split('/')[-1].split('.')[0] + "_Adaptive_Huffman_encoded"
+    decode_to_file = "./Decoded_Files/" + file_name.split('/')[-1].split('.')[0] + "_Adaptive_Huffman_decoded"
+
+    original_checksum = StreamChecksum()
+    decoded_checksum = StreamChecksum()
+
+    # start and end timers for encoding
+    start = timer()
+    with open(file_name, "rb") as f, open(enc_msg_file, "wb") as out:
+        write_blocks(Adaptive_Huffman_Encoding(original_checksum.update(map_blocks(f, CHUNK_SIZE))), out)
+    end = timer()
+    encode_time = end - start
 
     # start and end timers for decoding
     start = timer()
-    decode_output = Huffman_Decoding(encoding,tree)
+    with open(enc_msg_file, "rb") as f, open(decode_to_file, "wb") as out:
+        write_blocks(decoded_checksum.update(Adaptive_Huffman_Decoding(map_blocks(f, CHUNK_SIZE))), out)
     end = timer()
     decode_time = end - start
 
     # check if orignal text and decoded output matches
-    if data_content == decode_output:
-        print("Original and Decoded file MATCH")
+    with phase('adaptive huffman', 'verify'):
+        offset = None if original_checksum.matches(decoded_checksum) else first_mismatch(file_name, decode_to_file)
+    if offset is None:
+        logger.info("Original and Decoded file MATCH")
     else:
-        print("Original and Decoded file DO NOT MATCh")
+        logger.warning("Original and Decoded file DO NOT MATCH from byte %d", offset)
 
-    decode_to_file = "./Decoded_Files/" + file_name.split('/')[-1].split('.')[0] + "_Huffman_decoded"
-    with open(decode_to_file, "w+") as f:
-        f.write(encoding)
+    logger.info("data size = %d", datasize)
+    logger.info("Encoding Time = %f", encode_time)
+    logger.info("Decoding Time = %f", decode_time)
+
+    # return the metrics
+    return datasize/1024, os.path.getsize(enc_msg_file)/1024, encode_time, decode_time
+
+"""A helper function to encode a stream of bytes word by word. Every distinct word is mapped to an integer symbol,
+   and the symbols of every block are Huffman coded with at most max_code_length bits, or the fewest bits able to
+   number the words of the block when there are more of them. Every block is written as two frames: the words
+   first seen in it, each one prefixed with its length, then its coded symbols"""
+def Word_Huffman_Encoding(data_blocks, max_code_length=DECODE_TABLE_BITS):
+    words = dict()
+    carry = b''
+    for block in data_blocks:
+        tokens = WORD_TOKENS.findall(carry + block)
+        # a word ending the block may go on in the next one
+        carry = tokens.pop() if tokens and WORD_START.match(tokens[-1]) else b''
+        if tokens:
+            yield from Encode_Words(tokens, words, max_code_length)
+    if carry:
+        yield from Encode_Words([carry], words, max_code_length)
+
+"""A helper function to encode the tokens of a block for Word_Huffman_Encoding, adding their new words to words"""
+def Encode_Words(tokens, words, max_code_length):
+    word_count = len(words)
+    symbols = [words.setdefault(word, len(words)) for word in tokens]
+    block_words = len(set(symbols))
+    encoded_symbols, _ = Huffman_Encoding(symbols, max(max_code_length, (block_words - 1).bit_length()))
+    return frame_blocks([b''.join(frame_blocks(islice(words, word_count, None))), encoded_symbols])
+
+"""A helper function to decode a stream encoded by Word_Huffman_Encoding, block by block"""
+def Word_Huffman_Decoding(encoded_chunks):
+    words = []
+    frames = read_frames(encoded_chunks)
+    for new_words in frames:
+        words.extend(read_frames([new_words]))
+        encoded_symbols = next(frames, None)
+        if encoded_symbols is None:
+            raise ValueError("truncated stream")
+        yield b''.join(map(words.__getitem__, Huffman_Decoding(encoded_symbols)))
+
+""" The driver function for word level Huffman Encoding, see Word_Huffman_Encoding.
+    The file is streamed block by block, so its size is not bounded by memory """
+def doWordHuffman(file_name, max_code_length=DECODE_TABLE_BITS):
+
+    datasize = os.path.getsize(file_name)
+
+    enc_msg_file = "./Encoded_Files/" + file_name.split('/')[-1].split('.')[0] + "_Word_Huffman_encoded"
+    decode_to_file = "./Decoded_Files/" + file_name.split('/')[-1].split('.')[0] + "_Word_Huffman_decoded"
+
+    original_checksum = StreamChecksum()
+    decoded_checksum = StreamChecksum()
+
+    # start and end timers for encoding
+    start = timer()
+    with open(file_name, "rb") as f, open(enc_msg_file, "wb") as out:
+        write_blocks(Word_Huffman_Encoding(original_checksum.update(map_blocks(f)), max_code_length), out)
+    end = timer()
+    encode_time = end - start
+
+    # start and end timers for decoding
+    start = timer()
+    with open(enc_msg_file, "rb") as f, open(decode_to_file, "wb") as out:
+        write_blocks(decoded_checksum.update(Word_Huffman_Decoding(map_blocks(f))), out)
+    end = timer()
+    decode_time = end - start
+
+    # check if orignal text and decoded output matches
+    with phase('word huffman', 'verify'):
+        offset = None if original_checksum.matches(decoded_checksum) else first_mismatch(file_name, decode_to_file)
+    if offset is None:
+        logger.info("Original and Decoded file MATCH")
+    else:
+        logger.warning("Original and Decoded file DO NOT MATCH from byte %d", offset)
 
-    print("data size = ", datasize)
-    print("Encoding Time = ", encode_time)
-    print("Deconding Time = ", decode_time)
-    print()
+    logger.info("data size = %d", datasize)
+    logger.info("Encoding Time = %f", encode_time)
+    logger.info("Decoding Time = %f", decode_time)
 
     # return the metrics
-    return (size_before_compression//8)/1024, ceil(size_after_compression/8)/1024, encode_time, decode_time
\ No newline at end of file
+    return datasize/1024, os.path.getsize(enc_msg_file)/1024, encode_time, decode_time
@@ -0,0 +1,178 @@
+import logging
+from timeit import default_timer as timer
+
+logger = logging.getLogger(__name__)
+
+# Functions called with every metrics event, instrumentation is disabled while there are none
+_sinks = []
+
+def add_sink(sink):
+    '''
+        Registers a metrics sink
+
+        Parameters:
+            sink: function called with every event, a dictionary with the codec, the phase, its duration in seconds
+                  (for timed phases) and the values reported for it (byte counts, table sizes...)
+
+        Return:
+            The sink, so that it can be removed later
+    '''
+    _sinks.append(sink)
+    return sink
+
+def remove_sink(sink):
+    '''
+        Unregisters a metrics sink
+
+        Parameters:
+            sink: a sink registered by add_sink
+
+        Return:
+            None
+    '''
+    _sinks.remove(sink)
+
+def enabled():
+    '''
+        Tells whether any sink is registered, for callers which would otherwise compute values for nothing
+
+        Return:
+            True if events are delivered, false otherwise
+    '''
+    return bool(_sinks)
+
+def emit(event):
+    for sink in tuple(_sinks):
+        sink(event)
+
+class Phase:
+    '''
+        Context manager timing a phase of a codec and reporting it to the sinks on exit
+    '''
+    __slots__ = ('event', 'start')
+
+    def __init__(self, codec, phase, values):
+        self.event = {'codec': codec, 'phase': phase}
+        self.event.update(values)
+
+    def __enter__(self):
+        self.start = timer()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.event['seconds'] = timer() - self.start
+        emit(self.event)
+
+    def add(self, **values):
+        '''
+            Adds values to the event of the phase, such as the size of its output
+
+            Parameters:
+                values: the values by name
+
+            Return:
+                None
+        '''
+        self.event.update(values)
+
+class NullPhase:
+    '''
+        Stands in for Phase while instrumentation is disabled, doing nothing
+    '''
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def add(self, **values):
+        pass
+
+NULL_PHASE = NullPhase()
+
+def phase(codec, name, **values):
+    '''
+        Times a phase of a codec, to be used as a context manager
+
+        Parameters:
+            codec: name of the codec
+            name: name of the phase, such as 'model', 'table', 'encode', 'decode', 'write' or 'verify'
+            values: values known when the phase starts
+
+        Return:
+            A context manager, which does nothing while no sink is registered
+    '''
+    if not _sinks:
+        return NULL_PHASE
+    return Phase(codec, name, values)
+
+def report(codec, name, **values):
+    '''
+        Reports values which are not tied to a timed phase, such as the final size of a dictionary
+
+        Parameters:
+            codec: name of the codec
+            name: name of the phase the values belong to
+            values: the values by name
+
+        Return:
+            None
+    '''
+    if _sinks:
+        event = {'codec': codec, 'phase': name}
+        event.update(values)
+        emit(event)
+
+class MetricsRecorder:
+    '''
+        Sink keeping every event, with totals per codec and phase
+    '''
+    def __init__(self):
+        self.events = []
+
+    def __call__(self, event):
+        self.events.append(event)
+
+    def totals(self):
+        '''
+            Sums the numeric values of the events per codec and phase
+
+            Return:
+                A dictionary from (codec, phase) to a dictionary of totals, including the number of events
+        '''
+        totals = {}
+        for event in self.events:
+            total = totals.setdefault((event['codec'], event['phase']), {'events': 0})
+            total['events'] += 1
+            for name, value in event.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    total[name] = total.get(name, 0) + value
+        return totals
+
+def record_events(function, *args):
+    '''
+        Calls a function with its events kept rather than delivered, for functions run in worker processes
+        whose events would otherwise only reach the sinks of the worker
+
+        Parameters:
+            function: the function
+            args: its arguments
+
+        Return:
+            The result of the function and the list of its events, to be passed to emit
+    '''
+    sinks = _sinks[:]
+    recorder = MetricsRecorder()
+    _sinks[:] = [recorder]
+    try:
+        return function(*args), recorder.events
+    finally:
+        _sinks[:] = sinks
+
+def log_sink(event):
+    '''
+        Sink writing every event to the log at the DEBUG level
+    '''
+    logger.debug("%s", event)
@@ -0,0 +1,370 @@
+import logging
+from array import array
+from os.path import getsize
+from struct import calcsize, pack, unpack_from
+from timeit import default_timer as timer
+
+import Huffman_Encoding
+from Instrumentation import phase, report
+from Stream_IO import StreamChecksum, first_mismatch, frame_blocks, map_blocks, read_frames, write_blocks
+
+logger = logging.getLogger(__name__)
+
+# Matches are at least MIN_MATCH and at most MAX_MATCH bytes long, at most 1 << window_bits bytes back
+MIN_MATCH = 3
+MAX_MATCH = 1 << 16
+WINDOW_BITS = 15
+MAX_WINDOW_BITS = 24
+
+# Speed/ratio tradeoff of every level: the number of hash chain entries tried per position, the match length
+# which stops the search early, and whether a match is deferred when the next position has a longer one
+LEVELS = {
+    1: (4, 16, False),
+    2: (8, 32, False),
+    3: (16, 64, False),
+    4: (16, 32, True),
+    5: (32, 64, True),
+    6: (64, 128, True),
+    7: (128, 256, True),
+    8: (256, 1024, True),
+    9: (1024, MAX_MATCH, True),
+}
+DEFAULT_LEVEL = 6
+
+# The data is split into sequences, each one a run of literals followed by a match. Run lengths, match lengths and
+# distances are mapped to byte codes: values below DIRECT_VALUES are their own code, larger ones share a code with
+# the values of the same bit length and second highest bit, the bits below those being sent as extra bits
+DIRECT_VALUES = 16
+
+# An encoded block holds the lengths of its four Huffman coded streams (see Huffman_Encoding.Huffman_Encode_Block):
+# the literals, the run codes, the match codes and the distance codes, followed by the streams and the extra bits.
+# Match codes hold the match length - MIN_MATCH + 1, 0 marking the final sequence which has no match,
+# and distance codes hold the distance - 1
+BLOCK_HEADER_FORMAT = '>IIII'
+BLOCK_HEADER_SIZE = calcsize(BLOCK_HEADER_FORMAT)
+
+def find_sequences(data, level=DEFAULT_LEVEL, window_bits=WINDOW_BITS):
+    '''
+        Finds the matches of the data with hash chains: every position is chained to the previous one starting
+        with the same MIN_MATCH bytes
+
+        Parameters:
+            data: the bytes, or any bytes-like object
+            level: 1 (fastest) to 9 (smallest), see LEVELS
+            window_bits: log2 of the largest distance of a match
+
+        Return:
+            A generator of (literal start, literal end, match length, distance), the last sequence having no match
+    '''
+    # the hash keys are slices of the data, which have to be hashable whatever the bytes-like type of the block
+    data = bytes(data)
+    max_chain, nice_length, lazy = LEVELS[level]
+    window = 1 << window_bits
+    length_of_data = len(data)
+    last = length_of_data - MIN_MATCH
+    head = {}
+    # previous position with the same hash key, plus one so that 0 ends the chain
+    chain = array('I', bytes(4 * max(last + 1, 0)))
+    inserted = 0
+
+    def longest_match(position):
+        nonlocal inserted
+        for earlier in range(inserted, position):
+            key = data[earlier:earlier + MIN_MATCH]
+            chain[earlier] = head.get(key, 0)
+            head[key] = earlier + 1
+        key = data[position:position + MIN_MATCH]
+        candidate = head.get(key, 0) - 1
+        chain[position] = candidate + 1
+        head[key] = position + 1
+        inserted = position + 1
+
+        limit = min(MAX_MATCH, length_of_data - position)
+        best_length = MIN_MATCH - 1
+        best_distance = 0
+        tries = max_chain
+        while candidate >= 0 and position - candidate <= window and tries:
+            # a candidate can only be longer if it agrees one byte past the best match so far
+            if (data[candidate + best_length] == data[position + best_length]
+                    and data[candidate:candidate + best_length + 1] == data[position:position + best_length + 1]):
+                # short matches are extended byte by byte, long ones by growing steps, halving the step on a mismatch
+                length = best_length + 1
+                end = min(limit, length + 16)
+                while length < end and data[candidate + length] == data[position + length]:
+                    length += 1
+                step = 16
+                while length == end and length < limit:
+                    step = min(step, limit - length)
+                    if data[candidate + length:candidate + length + step] == data[position + length:position + length + step]:
+                        length += step
+                        end = length
+                        step *= 2
+                    elif step == 1:
+                        break
+                    else:
+                        step //= 2
+                best_length = length
+                best_distance = position - candidate
+                if length >= nice_length or length == limit:
+                    break
+            candidate = chain[candidate] - 1
+            tries -= 1
+        return best_length, best_distance
+
+    literal_start = 0
+    position = 0
+    while position <= last:
+        length, distance = longest_match(position)
+        if length < MIN_MATCH:
+            position += 1
+            continue
+        # lazy matching: a literal followed by a longer match beats the match found here
+        while lazy and length < nice_length and position < last:
+            next_length, next_distance = longest_match(position + 1)
+            if next_length <= length:
+                break
+            position += 1
+            length, distance = next_length, next_distance
+        yield literal_start, position, length, distance
+        position += length
+        literal_start = position
+    yield literal_start, length_of_data, 0, 0
+
+def value_code(value):
+    '''
+        Maps a value to its byte code and extra bits, see DIRECT_VALUES
+
+        Parameters:
+            value: a non negative integer below 1 << 32
+
+        Return:
+            The code, the number of extra bits and the extra bits
+    '''
+    if value < DIRECT_VALUES:
+        return value, 0, 0
+    bit_length = value.bit_length()
+    extra_bits = bit_length - 2
+    return DIRECT_VALUES + 2 * (bit_length - 5) + ((value >> extra_bits) & 1), extra_bits, value & ((1 << extra_bits) - 1)
+
+def encode_block(data, level=DEFAULT_LEVEL, window_bits=WINDOW_BITS):
+    '''
+        Encodes a block of bytes independently from any other
+
+        Parameters:
+            data: the bytes
+            level: 1 (fastest) to 9 (smallest), see LEVELS
+            window_bits: log2 of the largest distance of a match, up to MAX_WINDOW_BITS
+
+        Return:
+            The encoded bytes
+    '''
+    if level not in LEVELS:
+        raise ValueError("unknown level: {}".format(level))
+    if not 0 < window_bits <= MAX_WINDOW_BITS:
+        raise ValueError("window bits out of range: {}".format(window_bits))
+
+    literals = []
+    run_codes = bytearray()
+    match_codes = bytearray()
+    distance_codes = bytearray()
+    extra = bytearray()
+    bit_buffer = 0
+    buffered_bits = 0
+
+    with phase('lzss', 'match', data_bytes=len(data)) as match_phase:
+        sequences = 0
+        for literal_start, literal_end, length, distance in find_sequences(data, level, window_bits):
+            sequences += 1
+            literals.append(data[literal_start:literal_end])
+            values = [(literal_end - literal_start, run_codes)]
+            if length:
+                values += [(length - MIN_MATCH + 1, match_codes), (distance - 1, distance_codes)]
+            else:
+                match_codes.append(0)
+            for value, codes in values:
+                code, extra_bits, extra_value = value_code(value)
+                codes.append(code)
+                bit_buffer = (bit_buffer << extra_bits) | extra_value
+                buffered_bits += extra_bits
+                while buffered_bits >= 8:
+                    buffered_bits -= 8
+                    extra.append((bit_buffer >> buffered_bits) & 0xFF)
+                bit_buffer &= (1 << buffered_bits) - 1
+        if buffered_bits:
+            extra.append((bit_buffer << (8 - buffered_bits)) & 0xFF)
+        match_phase.add(sequences=sequences)
+
+    with phase('lzss', 'entropy') as entropy_phase:
+        streams = [Huffman_Encoding.Huffman_Encode_Block(stream)
+                   for stream in (b''.join(literals), bytes(run_codes), bytes(match_codes), bytes(distance_codes))]
+        encoded = pack(BLOCK_HEADER_FORMAT, *map(len, streams)) + b''.join(streams) + bytes(extra)
+        entropy_phase.add(encoded_bytes=len(encoded))
+    report('lzss', 'streams', literal_bytes=len(streams[0]), code_bytes=sum(map(len, streams[1:])), extra_bytes=len(extra))
+    return encoded
+
+def decode_block(encoded):
+    '''
+        Decodes a block encoded by encode_block
+
+        Parameters:
+            encoded: the encoded bytes
+
+        Return:
+            The decoded bytes
+    '''
+    with phase('lzss', 'decode', encoded_bytes=len(encoded)) as decode_phase:
+        stream_lengths = unpack_from(BLOCK_HEADER_FORMAT, encoded)
+        streams = []
+        offset = BLOCK_HEADER_SIZE
+        for stream_length in stream_lengths:
+            streams.append(Huffman_Encoding.Huffman_Decoding(encoded[offset:offset + stream_length]))
+            offset += stream_length
+        literals, run_codes, match_codes, distance_codes = streams
+        extra = encoded[offset:]
+
+        bit_buffer = 0
+        buffered_bits = 0
+        extra_position = 0
+
+        def read_value(code):
+            nonlocal bit_buffer, buffered_bits, extra_position
+            if code < DIRECT_VALUES:
+                return code
+            extra_bits = (code - DIRECT_VALUES) // 2 + 3
+            while buffered_bits < extra_bits:
+                bit_buffer = (bit_buffer << 8) | extra[extra_position]
+                extra_position += 1
+                buffered_bits += 8
+            buffered_bits -= extra_bits
+            value = ((2 | (code & 1)) << extra_bits) | (bit_buffer >> buffered_bits)
+            bit_buffer &= (1 << buffered_bits) - 1
+            return value
+
+        decoded = bytearray()
+        literal_position = 0
+        distances = iter(distance_codes)
+        for run_code, match_code in zip(run_codes, match_codes):
+            run = read_value(run_code)
+            decoded += literals[literal_position:literal_position + run]
+            literal_position += run
+            if not match_code:
+                continue
+            length = read_value(match_code) + MIN_MATCH - 1
+            distance = read_value(next(distances)) + 1
+            start = len(decoded) - distance
+            if start < 0:
+                raise ValueError("match distance out of range")
+            if distance >= length:
+                decoded += decoded[start:start + length]
+            else:
+                # the match overlaps its own output, repeating the last distance bytes
+                decoded += (decoded[start:] * (length // distance + 1))[:length]
+        decode_phase.add(decoded_bytes=len(decoded))
+
+    return bytes(decoded)
+
+def encode_stream(data_blocks, level=DEFAULT_LEVEL, window_bits=WINDOW_BITS):
+    '''
+        Encodes a stream of bytes block by block, every block prefixed with its encoded length
+
+        Parameters:
+            data_blocks: iterable of the blocks of bytes to be encoded
+            level: 1 (fastest) to 9 (smallest), see LEVELS
+            window_bits: log2 of the largest distance of a match
+
+        Return:
+            A generator of the encoded bytes
+    '''
+    return frame_blocks(encode_block(block, level, window_bits) for block in data_blocks if block)
+
+def decode_stream(encoded_chunks):
+    '''
+        Decodes a stream encoded by encode_stream
+
+        Parameters:
+            encoded_chunks: iterable of the encoded bytes
+
+        Return:
+            A generator of the decoded blocks
+    '''
+    for encoded_block in read_frames(encoded_chunks):
+        yield decode_block(encoded_block)
+
+def encode_file(file_to_encode, level=DEFAULT_LEVEL, checksum=None):
+    '''
+        Encodes the file using LZSS encoding
+
+        Parameters:
+            file_to_encode: name of the file to be encoded
+            level: 1 (fastest) to 9 (smallest), see LEVELS
+            checksum: optional StreamChecksum updated with the data read
+
+        Return:
+            name of the encoded file
+    '''
+    enc_file = "./Encoded_Files/" + file_to_encode.split('/')[-1].split('.')[0] + "_LZSS_encoded"
+
+    with open(file_to_encode, "rb") as file, open(enc_file, "wb") as output_file:
+        blocks = map_blocks(file)
+        if checksum is not None:
+            blocks = checksum.update(blocks)
+        write_blocks(encode_stream(blocks, level), output_file)
+
+    return enc_file
+
+def decode_file(encoded_file, decode_to_file, checksum=None):
+    '''
+        Decodes the file using LZSS encoding
+
+        Parameters:
+            encoded_file: name of the encoded file
+            decode_to_file: name of the file used while writing the decoded output
+            checksum: optional StreamChecksum updated with the decoded data
+
+        Return:
+            None
+    '''
+    with open(encoded_file, "rb") as file, open(decode_to_file, "wb") as output_file:
+        blocks = decode_stream(map_blocks(file))
+        if checksum is not None:
+            blocks = checksum.update(blocks)
+        write_blocks(blocks, output_file)
+
+def do_LZSS(file_to_be_encoded, level=DEFAULT_LEVEL):
+    """
+    Driver function for LZSS
+
+    Parameters:
+        file_to_be_encoded: name of the file to be encoded
+        level: 1 (fastest) to 9 (smallest), see LEVELS
+
+    Return:
+        Original file size in kB, Encoded file size in kB, Time taken for encoding, Time taken for decoding
+    """
+    original_checksum = StreamChecksum()
+    decoded_checksum = StreamChecksum()
+
+    start = timer()
+    encoded_file = encode_file(file_to_be_encoded, level, original_checksum)
+    end = timer()
+
+    enc_time = end - start
+
+    decode_to_file = "./Decoded_Files/" + file_to_be_encoded.split('/')[-1].split('.')[0] + "_LZSS_decoded"
+
+    start = timer()
+    decode_file(encoded_file, decode_to_file, decoded_checksum)
+    end = timer()
+
+    dec_time = end - start
+
+    logger.info("Encoding Time = %f, Decoding Time = %f", enc_time, dec_time)
+
+    with phase('lzss', 'verify'):
+        offset = None if original_checksum.matches(decoded_checksum) else first_mismatch(file_to_be_encoded, decode_to_file)
+    if offset is None:
+        logger.info("Original and Decoded file MATCH!")
+    else:
+        logger.warning("Original and Decoded file DO NOT MATCH from byte %d", offset)
+
+    return (getsize(file_to_be_encoded)/1024, getsize(encoded_file)/1024, enc_time, dec_time)
@@ -1,105 +1,383 @@
-import sys
-from sys import argv
-from struct import *
+import logging
+from array import array
 from timeit import default_timer as timer
 from os.path import getsize
-from difflib import SequenceMatcher
 
-def encode_file(file_to_encode):
+from Instrumentation import phase, report
+from Stream_IO import StreamChecksum, first_mismatch, map_blocks, write_blocks
+
+logger = logging.getLogger(__name__)
+
+# Codes 0 - 255 stand for the single bytes, CLEAR_CODE tells the decoder to reset its dictionary
+# and the codes of the dictionary entries start at FIRST_CODE
+CLEAR_CODE = 256
+FIRST_CODE = 257
+
+# Codes are written with 9 bits, growing up to 16 bits as the dictionary fills
+MIN_CODE_WIDTH = 9
+MAX_CODE_WIDTH = 16
+MAX_CODES = 1 << MAX_CODE_WIDTH
+
+# Size of the buffers the encoded and decoded output is gathered in before it is handed out
+OUTPUT_BUFFER_SIZE = 1 << 20
+
+# The encoder finds the strings in an open addressing hash table of HASH_SIZE slots, twice the number of codes.
+# A slot holds the code of a string, 0 when empty, and the key of every code, (prefix code << 8) | last byte,
+# is kept in an array indexed by code. The slot of a key is the top HASH_BITS bits of the low 32 bits of
+# key * HASH_MULTIPLIER, which scatters the keys of consecutive codes, the next slots being tried in turn on a collision
+HASH_BITS = MAX_CODE_WIDTH + 1
+HASH_SIZE = 1 << HASH_BITS
+HASH_MASK = HASH_SIZE - 1
+HASH_MULTIPLIER = 0x9E3779B1
+HASH_SHIFT = 32 - HASH_BITS
+
+def find_slot(slots, keys, key, slot=None):
     '''
-        Encodes the file using LZW encoding
+        Looks up a string in the hash table
 
         Parameters:
-            file_to_encoded: name of the file to be encoded
+            slots: array of HASH_SIZE codes
+            keys: array of the key of every code
+            key: (prefix code << 8) | last byte of the string
+            slot: optional slot to start probing from, the slot the key hashes to by default
 
         Return:
-            name of the encoded file
+            The slot holding the code of the string, or the empty slot it would be added to, and that code or 0
+    '''
+    if slot is None:
+        slot = ((key * HASH_MULTIPLIER) & 0xFFFFFFFF) >> HASH_SHIFT
+    code = slots[slot]
+    while code and keys[code] != key:
+        slot = (slot + 1) & HASH_MASK
+        code = slots[slot]
+    return slot, code
+
+def encode_stream(data_blocks, char_map=None):
     '''
-    maximum_table_size = pow(2,int(16))      
-    file = open(file_to_encode)                 
-    data = file.read()                      
-    file.close()
+        Encodes a stream of bytes using LZW encoding
 
-    # Initialize the character map to the ASCII value for each key from 0 - 255
-    size = 256                   
-    char_map = {chr(i): i for i in range(size)}    
-    string = ""             
-    encoded_msg = []    
+        Parameters:
+            data_blocks: iterable of the blocks of bytes to be encoded
+            char_map: optional empty dictionary, left holding the symbol table once encoding is over,
+                      from the key of every string (see HASH_SIZE) to its code
+
+        Return:
+            A generator of the encoded bytes
+    '''
+    # The hash table only holds the multi byte strings, its size is fixed whatever the input
+    slots = array('H', bytes(2 * HASH_SIZE))
+    keys = array('I', bytes(4 * MAX_CODES))
+    next_code = FIRST_CODE
+    code_width = MIN_CODE_WIDTH
+    resets = 0
+    encoded_msg = bytearray()
+    bit_buffer = 0
+    buffered_bits = 0
 
     # Iterate through each symbol in the input data and encode it based on the char map
     # Adds to the map when a combination of symbols is found
-    for symbol in data:                     
-        string_plus_symbol = string + symbol
-        if string_plus_symbol in char_map: 
-            string = string_plus_symbol
-        else:
-            encoded_msg.append(char_map[string])
-            if(len(char_map) <= maximum_table_size):
-                char_map[string_plus_symbol] = size
-                size += 1
-            string = symbol
-
-    # Add the last string to the encoded message if required
-    if string in char_map:
-        encoded_msg.append(char_map[string])
+    string_code = None
+    for data in data_blocks:
+        if string_code is None:
+            if not data:
+                continue
+            string_code = data[0]
+            data = data[1:]
+
+        for symbol in data:
+            # the first slot probed is looked up here, find_slot only being called on a collision
+            key = (string_code << 8) | symbol
+            slot = ((key * HASH_MULTIPLIER) & 0xFFFFFFFF) >> HASH_SHIFT
+            code = slots[slot]
+            if code and keys[code] != key:
+                slot, code = find_slot(slots, keys, key, slot)
+            if code:
+                string_code = code
+                continue
+
+            bit_buffer = (bit_buffer << code_width) | string_code
+            buffered_bits += code_width
+            if next_code < MAX_CODES:
+                slots[slot] = next_code
+                keys[next_code] = key
+                next_code += 1
+                if next_code - 1 == 1 << code_width:
+                    code_width += 1
+            else:
+                # The table is full, start over with an empty one
+                bit_buffer = (bit_buffer << code_width) | CLEAR_CODE
+                buffered_bits += code_width
+                slots = array('H', bytes(2 * HASH_SIZE))
+                next_code = FIRST_CODE
+                code_width = MIN_CODE_WIDTH
+                resets += 1
+            string_code = symbol
+
+            while buffered_bits >= 8:
+                buffered_bits -= 8
+                encoded_msg.append(bit_buffer >> buffered_bits)
+                bit_buffer &= (1 << buffered_bits) - 1
+
+        if len(encoded_msg) >= OUTPUT_BUFFER_SIZE:
+            yield bytes(encoded_msg)
+            encoded_msg = bytearray()
+
+    # Add the last string to the encoded message if required, then pad the last byte with zeros
+    if string_code is not None:
+        bit_buffer = (bit_buffer << code_width) | string_code
+        buffered_bits += code_width
+    padding = -buffered_bits % 8
+    encoded_msg.extend((bit_buffer << padding).to_bytes((buffered_bits + padding) // 8, 'big'))
+
+    if char_map is not None:
+        char_map.update((keys[code], code) for code in range(FIRST_CODE, next_code))
+    report('lzw', 'encode', dictionary_size=next_code - FIRST_CODE, code_width=code_width, dictionary_resets=resets)
+    yield bytes(encoded_msg)
+
+def decode_stream(encoded_blocks):
+    '''
+        Decodes a stream encoded by encode_stream
 
+        Parameters:
+            encoded_blocks: iterable of the blocks of encoded bytes
+
+        Return:
+            A generator of the decoded bytes, in blocks of at most OUTPUT_BUFFER_SIZE bytes
+    '''
+    # Every code stands for the string of its prefix code followed by its suffix byte,
+    # codes 0 - 255 being the single bytes. The length and first byte of each string are kept
+    # so that a string is expanded straight into the output buffer, from its last byte backwards.
+    # Codes and lengths are below MAX_CODES, so the arrays take a fixed 6 bytes per code
+    prefix = array('H', bytes(2 * MAX_CODES))
+    suffix = bytearray(range(CLEAR_CODE)) + bytearray(MAX_CODES - CLEAR_CODE)
+    first = bytearray(suffix)
+    length = array('H', [1]) * MAX_CODES
+
+    next_code = FIRST_CODE
+    code_width = MIN_CODE_WIDTH
+    previous = None
+    bit_buffer = 0
+    buffered_bits = 0
+
+    # A string is at most MAX_CODES long, so it always fits the output buffer once it is flushed
+    output_buffer = bytearray(OUTPUT_BUFFER_SIZE)
+    position = 0
+
+    # Iterate through each encoded value and dencode it based on the arrays
+    # Adds to the arrays when a combination of symbols is found
+    for encoded_data in encoded_blocks:
+        for byte in encoded_data:
+            bit_buffer = (bit_buffer << 8) | byte
+            buffered_bits += 8
+            if buffered_bits < code_width:
+                continue
+            buffered_bits -= code_width
+            code = bit_buffer >> buffered_bits
+            bit_buffer &= (1 << buffered_bits) - 1
+
+            if code == CLEAR_CODE:
+                next_code = FIRST_CODE
+                code_width = MIN_CODE_WIDTH
+                previous = None
+                continue
+
+            if previous is not None:
+                # The new entry is the previous string followed by the first byte of the current one,
+                # which is also the first byte of the previous string when the code is not known yet
+                prefix[next_code] = previous
+                suffix[next_code] = first[previous] if code == next_code else first[code]
+                first[next_code] = first[previous]
+                length[next_code] = length[previous] + 1
+                next_code += 1
+                if next_code == 1 << code_width and code_width < MAX_CODE_WIDTH:
+                    code_width += 1
+
+            string_length = length[code]
+            if position + string_length > OUTPUT_BUFFER_SIZE:
+                yield bytes(memoryview(output_buffer)[:position])
+                position = 0
+            index = position + string_length - 1
+            position += string_length
+            current = code
+            while index >= position - string_length:
+                output_buffer[index] = suffix[current]
+                current = prefix[current]
+                index -= 1
+
+            previous = code
+
+    report('lzw', 'decode', dictionary_size=next_code - FIRST_CODE, code_width=code_width)
+    yield bytes(memoryview(output_buffer)[:position])
+
+class PresetDictionary:
+    '''
+        LZW dictionary trained once on sample data and left unchanged afterwards, so that short messages are
+        encoded with the strings of the sample rather than each one starting from the 256 single bytes
+    '''
+    def __init__(self, sample_blocks, max_codes=MAX_CODES):
+        '''
+            Parameters:
+                sample_blocks: iterable of the blocks of bytes the dictionary is trained on
+                max_codes: number of codes at which training stops
+        '''
+        # The dictionary grows over the sample the same way as in encode_stream, without ever being cleared
+        slots = array('H', bytes(2 * HASH_SIZE))
+        keys = array('I', bytes(4 * max_codes))
+        next_code = FIRST_CODE
+        string_code = None
+        for data in sample_blocks:
+            for symbol in data:
+                if string_code is None:
+                    string_code = symbol
+                    continue
+                key = (string_code << 8) | symbol
+                slot, code = find_slot(slots, keys, key)
+                if code:
+                    string_code = code
+                    continue
+                if next_code < max_codes:
+                    slots[slot] = next_code
+                    keys[next_code] = key
+                    next_code += 1
+                string_code = symbol
+
+        self.slots = slots
+        self.keys = keys[:next_code]
+        self.code_width = max(MIN_CODE_WIDTH, (next_code - 1).bit_length())
+
+        # The decoding arrays, as in decode_stream. A prefix always has a smaller code than the strings extending it
+        self.prefix = array('H', bytes(2 * next_code))
+        self.suffix = bytearray(range(CLEAR_CODE)) + bytearray(next_code - CLEAR_CODE)
+        self.length = array('H', [1]) * next_code
+        for code in range(FIRST_CODE, next_code):
+            key = keys[code]
+            self.prefix[code] = key >> 8
+            self.suffix[code] = key & 0xFF
+            self.length[code] = self.length[key >> 8] + 1
+
+    def encode(self, data):
+        '''
+            Encodes a message with the dictionary, every code taking code_width bits
+
+            Parameters:
+                data: the bytes to be encoded
+
+            Return:
+                The encoded bytes
+        '''
+        slots = self.slots
+        keys = self.keys
+        code_width = self.code_width
+        encoded_msg = bytearray()
+        bit_buffer = 0
+        buffered_bits = 0
+
+        string_code = None
+        for symbol in data:
+            if string_code is not None:
+                code = find_slot(slots, keys, (string_code << 8) | symbol)[1]
+                if code:
+                    string_code = code
+                    continue
+                bit_buffer = (bit_buffer << code_width) | string_code
+                buffered_bits += code_width
+                while buffered_bits >= 8:
+                    buffered_bits -= 8
+                    encoded_msg.append(bit_buffer >> buffered_bits)
+                    bit_buffer &= (1 << buffered_bits) - 1
+            string_code = symbol
+
+        if string_code is not None:
+            bit_buffer = (bit_buffer << code_width) | string_code
+            buffered_bits += code_width
+        # The padding is shorter than a code, so the decoder needs no length
+        padding = -buffered_bits % 8
+        encoded_msg.extend((bit_buffer << padding).to_bytes((buffered_bits + padding) // 8, 'big'))
+        return bytes(encoded_msg)
+
+    def decode(self, encoded_msg):
+        '''
+            Decodes a message encoded by encode
+
+            Parameters:
+                encoded_msg: the encoded bytes
+
+            Return:
+                The decoded bytes
+        '''
+        prefix = self.prefix
+        suffix = self.suffix
+        length = self.length
+        code_width = self.code_width
+        decoded_msg = bytearray()
+        bit_buffer = 0
+        buffered_bits = 0
+        for byte in encoded_msg:
+            bit_buffer = (bit_buffer << 8) | byte
+            buffered_bits += 8
+            if buffered_bits < code_width:
+                continue
+            buffered_bits -= code_width
+            code = bit_buffer >> buffered_bits
+            bit_buffer &= (1 << buffered_bits) - 1
+
+            # The string is expanded from its last byte backwards
+            string_length = length[code]
+            decoded_msg.extend(bytes(string_length))
+            index = len(decoded_msg) - 1
+            for _ in range(string_length):
+                decoded_msg[index] = suffix[code]
+                code = prefix[code]
+                index -= 1
+
+        return bytes(decoded_msg)
+
+def encode_file(file_to_encode, checksum=None):
+    '''
+        Encodes the file using LZW encoding
+
+        Parameters:
+            file_to_encoded: name of the file to be encoded
+            checksum: optional StreamChecksum updated with the data read
+
+        Return:
+            name of the encoded file
+    '''
     # Write the encoded data into a file
     enc_file = "./Encoded_Files/" + file_to_encode.split('/')[-1].split('.')[0] + "_LZW_encoded"
-    
-    print()
-    print("LZW: Symbol Table")
-    print(char_map)
-
-    with open(enc_file, "wb") as output_file:
-        for data in encoded_msg:
-            output_file.write(pack('>H',int(data)))
-            
+
+    # the symbol table is only gathered into a dictionary for the debug log
+    char_map = {} if logger.isEnabledFor(logging.DEBUG) else None
+    with phase('lzw', 'encode file') as encode_phase:
+        with open(file_to_encode, "rb") as file, open(enc_file, "wb") as output_file:
+            blocks = map_blocks(file)
+            if checksum is not None:
+                blocks = checksum.update(blocks)
+            encode_phase.add(encoded_bytes=write_blocks(encode_stream(blocks, char_map), output_file))
+
+    if char_map is not None:
+        logger.debug("LZW: Symbol Table %s", char_map)
+
     return enc_file
 
-def decode_file(encoded_file, decode_to_file):
+def decode_file(encoded_file, decode_to_file, checksum=None):
     '''
         Decodes the file using LZW encoding
 
         Parameters:
             encoded_file: name of the file to be encoded
             decode_to_file: name of the file used while writing the decoded output
+            checksum: optional StreamChecksum updated with the decoded data
 
         Return:
             None
     '''
-    encoded_msg = []
-    next_code = 256
-    deencoded_msg = ""
-    string = ""
-
-    # Read the encoded file
-    with open(encoded_file, "rb") as file:
-        while True:
-            rec = file.read(2)
-            if len(rec) != 2:
-                break
-            (data, ) = unpack('>H', rec)
-            encoded_msg.append(data)
-
-    # Initialize the character map to the ASCII value for each key from 0 - 255 as done in encoding
-    size = 256
-    char_map = dict([(x, chr(x)) for x in range(size)])
-
-    # Iterate through each encoded value and dencode it based on the char map
-    # Adds to the map when a combination of symbols is found
-    for code in encoded_msg:
-        if not (code in char_map):
-            char_map[code] = string + (string[0])
-        deencoded_msg += char_map[code]
-        if not(len(string) == 0):
-            char_map[next_code] = string + (char_map[code][0])
-            next_code += 1
-        string = char_map[code]
-
-    # Write the decoded output to the file
-    with open(decode_to_file, "w") as output_file:
-        for data in deencoded_msg:
-            output_file.write(data)
+    with phase('lzw', 'decode file') as decode_phase:
+        with open(encoded_file, "rb") as file, open(decode_to_file, "wb") as output_file:
+            blocks = decode_stream(map_blocks(file))
+            if checksum is not None:
+                blocks = checksum.update(blocks)
+            decode_phase.add(decoded_bytes=write_blocks(blocks, output_file))
 
 def get_compression_ratio(original_file, encoded_file):
     """
@@ -126,15 +404,12 @@ def verify(original_file, decoded_file):
         decoded_file: Name of the decoded file
     Return:
         True if the files match, false otherwise
-    """ 
-    text1 = open(original_file).read()
-    text2 = open(decoded_file).read()
-    m = SequenceMatcher(None, text1, text2)
-    
-    if m.ratio() == 1.0:
-        return True
-    
-    return False
+    """
+    offset = first_mismatch(original_file, decoded_file)
+    if offset is not None:
+        logger.warning("Original and Decoded file differ from byte %d", offset)
+        return False
+    return True
 
 def do_Lempel_Ziv_Welch(file_to_be_encoded):
     """
@@ -146,8 +421,11 @@ def do_Lempel_Ziv_Welch(file_to_be_encoded):
     Return:
         Original file size in kB, Encoded file size in kB, Time taken for encoding, Time taken for decoding
     """
+    original_checksum = StreamChecksum()
+    decoded_checksum = StreamChecksum()
+
     start = timer()
-    encoded_file = encode_file(file_to_be_encoded)
+    encoded_file = encode_file(file_to_be_encoded, original_checksum)
     end = timer()
 
     enc_time = end - start
@@ -155,17 +433,21 @@ def do_Lempel_Ziv_Welch(file_to_be_encoded):
     decode_to_file = "./Decoded_Files/" + file_to_be_encoded.split('/')[-1].split('.')[0] + "_LZW_decoded"
 
     start = timer()
-    decode_file(encoded_file, decode_to_file)
+    decode_file(encoded_file, decode_to_file, decoded_checksum)
     end = timer()
 
     dec_time = end - start
 
-    print(enc_time, dec_time)
+    logger.info("Encoding Time = %f, Decoding Time = %f", enc_time, dec_time)
 
     og_size, enc_size, ratio = get_compression_ratio(file_to_be_encoded, encoded_file)
 
-    result = verify(file_to_be_encoded, decode_to_file)
-    print("Original and Decoded file", "MATCH!" if result == 1.0 else "DO NOT MATCH!")
+    with phase('lzw', 'verify'):
+        result = original_checksum.matches(decoded_checksum) or verify(file_to_be_encoded, decode_to_file)
+    if result:
+        logger.info("Original and Decoded file MATCH!")
+    else:
+        logger.warning("Original and Decoded file DO NOT MATCH!")
     
     return (og_size/1024, enc_size/1024, enc_time, dec_time)
 
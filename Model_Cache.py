@@ -0,0 +1,209 @@
+from collections import OrderedDict
+
+import Arithematic_Encoding
+import Huffman_Encoding
+import LZW_Encoding
+from Stream_IO import read_blocks
+
+# Number of trained models kept, the least recently used one is dropped to make room for a new one
+MODEL_CACHE_SIZE = 16
+
+# Codes of the trained Huffman tables are limited so that their decoding tables stay small
+MODEL_MAX_CODE_LENGTH = 20
+
+def count_symbols(sample_blocks):
+    '''
+        Counts the bytes of sample data, every byte value counting at least once so that any message can be encoded
+
+        Parameters:
+            sample_blocks: iterable of the blocks of bytes
+
+        Return:
+            A dictionary from every byte value to its count
+    '''
+    counts = dict.fromkeys(range(256), 1)
+    for block in sample_blocks:
+        for symbol, count in Huffman_Encoding.Calculate_Probability(block).items():
+            counts[symbol] += count
+    return counts
+
+def encode_length(length):
+    '''
+        Encodes a length in 7 bit groups, the high bit of every byte but the last one set
+
+        Parameters:
+            length: a non negative integer
+
+        Return:
+            The encoded bytes
+    '''
+    encoded = bytearray()
+    while length >= 0x80:
+        encoded.append(0x80 | (length & 0x7F))
+        length >>= 7
+    encoded.append(length)
+    return bytes(encoded)
+
+def decode_length(encoded, offset=0):
+    '''
+        Decodes a length encoded by encode_length
+
+        Parameters:
+            encoded: bytes holding the length
+            offset: offset of the length in encoded
+
+        Return:
+            The length and the offset following it
+    '''
+    length = 0
+    shift = 0
+    while True:
+        byte = encoded[offset]
+        offset += 1
+        length |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return length, offset
+        shift += 7
+
+class HuffmanModel:
+    '''
+        Static Huffman codes and decoding table trained on sample data.
+        A message is encoded as the number of bits padding its last byte followed by its codes, without any header.
+        The model is built once for many messages, so it decodes with the state machine whatever their size
+    '''
+    def __init__(self, sample_blocks):
+        symbol_with_probs = count_symbols(sample_blocks)
+        code_lengths, self.coding, _ = Huffman_Encoding.Build_Codes(symbol_with_probs, MODEL_MAX_CODE_LENGTH)
+        self.decoding_table = Huffman_Encoding.Build_Decoding_Table(code_lengths)
+        self.decoding_fsm = Huffman_Encoding.Build_Decoding_FSM(code_lengths)
+
+    def encode(self, data):
+        encoded_output, padding = Huffman_Encoding.Output_Encoded(data, self.coding)
+        return bytes((padding, )) + encoded_output
+
+    def decode(self, encoded):
+        if self.decoding_fsm is not None:
+            return Huffman_Encoding.Decode_Payload_FSM(encoded, 1, encoded[0], Huffman_Encoding.BYTE_SYMBOLS, self.decoding_fsm)
+        return Huffman_Encoding.Decode_Payload(encoded, 1, encoded[0], Huffman_Encoding.BYTE_SYMBOLS, self.decoding_table)
+
+class ArithmeticModel:
+    '''
+        Static frequency table trained on sample data.
+        A message is encoded as its length followed by the output of the range coder
+    '''
+    def __init__(self, sample_blocks):
+        self.encoding = Arithematic_Encoding.ArithmeticEncoding(count_symbols(sample_blocks))
+
+    def encode(self, data):
+        return encode_length(len(data)) + self.encoding.encode(data)
+
+    def decode(self, encoded):
+        length, offset = decode_length(encoded)
+        return self.encoding.decode(encoded[offset:], length)[1]
+
+# Model class of every codec, each one trained from an iterable of blocks of bytes
+MODELS = {
+    'huffman': HuffmanModel,
+    'lzw': LZW_Encoding.PresetDictionary,
+    'arithmetic': ArithmeticModel,
+}
+
+def read_sample(sample_files):
+    '''
+        Reads sample files one block after the other
+
+        Parameters:
+            sample_files: names of the files
+
+        Return:
+            A generator of the blocks of bytes
+    '''
+    for sample_file in sample_files:
+        with open(sample_file, "rb") as f:
+            yield from read_blocks(f)
+
+class ModelCache:
+    '''
+        Least recently used cache of trained models, keyed by model id: the codec and the sample files
+    '''
+    def __init__(self, capacity=MODEL_CACHE_SIZE):
+        self.capacity = capacity
+        self.models = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, codec, sample_files):
+        '''
+            Looks up a model, training it on the sample files the first time
+
+            Parameters:
+                codec: 'huffman', 'lzw' or 'arithmetic'
+                sample_files: names of the files the model is trained on
+
+            Return:
+                The model, with encode and decode methods turning bytes into bytes
+        '''
+        if codec not in MODELS:
+            raise ValueError("unknown codec: {}".format(codec))
+
+        model_id = (codec, tuple(sample_files))
+        model = self.models.get(model_id)
+        if model is not None:
+            self.models.move_to_end(model_id)
+            self.hits += 1
+            return model
+
+        self.misses += 1
+        model = MODELS[codec](read_sample(sample_files))
+        self.add(model_id, model)
+        return model
+
+    def add(self, model_id, model):
+        '''
+            Adds a model trained elsewhere, such as one unpickled from another process
+
+            Parameters:
+                model_id: the key of the model
+                model: the model
+
+            Return:
+                None
+        '''
+        self.models[model_id] = model
+        self.models.move_to_end(model_id)
+        if len(self.models) > self.capacity:
+            self.models.popitem(last=False)
+
+# Cache shared by compress and decompress
+default_cache = ModelCache()
+
+def compress(codec, data, sample_files, cache=None):
+    '''
+        Encodes a short message with a model trained on sample files.
+        The encoded message carries no model, it is decoded by decompress with the same codec and sample files
+
+        Parameters:
+            codec: 'huffman', 'lzw' or 'arithmetic'
+            data: the bytes to be encoded
+            sample_files: names of the files the model is trained on
+            cache: the ModelCache, default_cache by default
+
+        Return:
+            The encoded bytes
+    '''
+    return (cache or default_cache).get(codec, sample_files).encode(data)
+
+def decompress(codec, encoded, sample_files, cache=None):
+    '''
+        Decodes a message encoded by compress
+
+        Parameters:
+            codec: 'huffman', 'lzw' or 'arithmetic'
+            encoded: the encoded bytes
+            sample_files: names of the files the model was trained on
+            cache: the ModelCache, default_cache by default
+
+        Return:
+            The decoded bytes
+    '''
+    return (cache or default_cache).get(codec, sample_files).decode(encoded)
@@ -0,0 +1,299 @@
+import mmap
+from io import UnsupportedOperation
+from struct import calcsize, pack, unpack_from
+from timeit import default_timer as timer
+from zlib import crc32
+
+from Instrumentation import enabled, report
+
+# Size of the blocks read from the input, and of the buffer collecting the output before it is written
+BLOCK_SIZE = 1 << 20
+
+# Codecs coding each block on its own prefix every encoded block with its length
+FRAME_FORMAT = '>I'
+FRAME_SIZE = calcsize(FRAME_FORMAT)
+
+def read_blocks(file_object, block_size=BLOCK_SIZE):
+    '''
+        Reads a binary file object in fixed size blocks
+
+        Parameters:
+            file_object: file object opened in binary mode, a pipe works as well
+            block_size: number of bytes per block
+
+        Return:
+            A generator of the blocks of bytes
+    '''
+    while True:
+        block = file_object.read(block_size)
+        if not block:
+            return
+        yield block
+
+def map_blocks(file_object, block_size=BLOCK_SIZE):
+    '''
+        Reads a binary file object in fixed size blocks through a memory map, without copying the blocks.
+        Falls back to read_blocks for file objects which cannot be mapped, such as pipes or empty files
+
+        Parameters:
+            file_object: file object opened in binary mode
+            block_size: number of bytes per block
+
+        Return:
+            A generator of memoryviews of the blocks, only valid as long as the file is open
+    '''
+    try:
+        mapped = mmap.mmap(file_object.fileno(), 0, access=mmap.ACCESS_READ)
+    except (AttributeError, OSError, UnsupportedOperation, ValueError):
+        yield from read_blocks(file_object, block_size)
+        return
+
+    # the map covers the whole file, the blocks start at the current position like read_blocks
+    start = file_object.tell()
+    view = memoryview(mapped)
+    try:
+        for offset in range(start, len(view), block_size):
+            yield view[offset:offset + block_size]
+        file_object.seek(0, 2)
+    finally:
+        view.release()
+        try:
+            mapped.close()
+        except BufferError:
+            # a block is still referenced, the map is closed along with it
+            pass
+
+def write_blocks(blocks, file_object, buffer_size=BLOCK_SIZE):
+    '''
+        Writes blocks of bytes to a binary file object, copying small blocks into a preallocated buffer
+        written at once, and writing the blocks which do not fit it as they are
+
+        Parameters:
+            blocks: iterable of bytes
+            file_object: file object opened in binary mode
+            buffer_size: size of the buffer
+
+        Return:
+            Number of bytes written
+    '''
+    buffer = memoryview(bytearray(buffer_size))
+    filled = 0
+    written = 0
+    # the time spent writing is only measured while instrumentation is enabled
+    timed = enabled()
+    write_seconds = 0.0
+    for block in blocks:
+        size = len(block)
+        if filled + size <= buffer_size:
+            buffer[filled:filled + size] = block
+            filled += size
+            continue
+
+        if timed:
+            start = timer()
+        file_object.write(buffer[:filled])
+        written += filled
+        filled = 0
+        if size < buffer_size:
+            buffer[:size] = block
+            filled = size
+        else:
+            file_object.write(block)
+            written += size
+        if timed:
+            write_seconds += timer() - start
+
+    if timed:
+        start = timer()
+    file_object.write(buffer[:filled])
+    written += filled
+    if timed:
+        report('io', 'write', seconds=write_seconds + timer() - start, written_bytes=written)
+    return written
+
+def frame_blocks(encoded_blocks):
+    '''
+        Prefixes every encoded block with its length
+
+        Parameters:
+            encoded_blocks: iterable of encoded blocks
+
+        Return:
+            A generator of the lengths and the encoded blocks, in turn
+    '''
+    # the length and the block are handed out separately rather than copied together
+    for encoded_block in encoded_blocks:
+        yield pack(FRAME_FORMAT, len(encoded_block))
+        yield encoded_block
+
+def read_frames(chunks):
+    '''
+        Splits a stream of framed blocks back into the encoded blocks, whatever the size of the chunks it comes in
+
+        Parameters:
+            chunks: iterable of bytes holding the framed blocks
+
+        Return:
+            A generator of the encoded blocks
+    '''
+    buffer = bytearray()
+    for chunk in chunks:
+        buffer += chunk
+        offset = 0
+        while len(buffer) - offset >= FRAME_SIZE:
+            (length, ) = unpack_from(FRAME_FORMAT, buffer, offset)
+            if len(buffer) - offset - FRAME_SIZE < length:
+                break
+            offset += FRAME_SIZE
+            yield bytes(buffer[offset:offset + length])
+            offset += length
+        del buffer[:offset]
+
+    if buffer:
+        raise ValueError("truncated block at the end of the stream")
+
+class StreamChecksum:
+    '''
+        Running CRC32 and length of the bytes passing through a stream, so that the input of an encoder and
+        the output of a decoder are compared without reading either of them again. The drivers of the codecs
+        only compare the files byte by byte, with first_mismatch, when the checksums differ
+    '''
+    def __init__(self):
+        self.crc = 0
+        self.length = 0
+
+    def update(self, blocks):
+        '''
+            Passes blocks through, adding them to the checksum
+
+            Parameters:
+                blocks: iterable of bytes
+
+            Return:
+                A generator of the same blocks
+        '''
+        for block in blocks:
+            self.crc = crc32(block, self.crc)
+            self.length += len(block)
+            yield block
+
+    def matches(self, other):
+        '''
+            Compares two checksums
+
+            Parameters:
+                other: the other StreamChecksum
+
+            Return:
+                True if both streams had the same length and CRC32, false otherwise
+        '''
+        return self.crc == other.crc and self.length == other.length
+
+def first_mismatch(first_file, second_file, block_size=BLOCK_SIZE):
+    '''
+        Compares two files block by block, only the first differing block being compared byte by byte
+
+        Parameters:
+            first_file: name of the first file
+            second_file: name of the second file
+            block_size: number of bytes compared at once
+
+        Return:
+            Offset of the first byte which differs, or at which the shorter file ends, None if the files match
+    '''
+    offset = 0
+    with open(first_file, "rb") as first, open(second_file, "rb") as second:
+        while True:
+            first_block = first.read(block_size)
+            second_block = second.read(block_size)
+            if first_block != second_block:
+                for index, (first_byte, second_byte) in enumerate(zip(first_block, second_block)):
+                    if first_byte != second_byte:
+                        return offset + index
+                return offset + min(len(first_block), len(second_block))
+            if not first_block:
+                return None
+            offset += len(first_block)
+
+def files_match(first_file, second_file, block_size=BLOCK_SIZE):
+    '''
+        Compares two files block by block
+
+        Parameters:
+            first_file: name of the first file
+            second_file: name of the second file
+            block_size: number of bytes compared at once
+
+        Return:
+            True if the files hold the same bytes, false otherwise
+    '''
+    return first_mismatch(first_file, second_file, block_size) is None
+
+def get_codec(codec):
+    '''
+        Looks up the streaming functions of a codec
+
+        Parameters:
+            codec: 'huffman', 'lzw', 'arithmetic', 'lzss' or 'bwt'
+
+        Return:
+            The encoding and decoding functions, both turning an iterable of bytes into a generator of bytes
+    '''
+    # imported here as the codec modules use the helpers above
+    if codec == 'huffman':
+        import Huffman_Encoding
+        return Huffman_Encoding.Huffman_Encoding_Stream, Huffman_Encoding.Huffman_Decoding_Stream
+    if codec == 'lzw':
+        import LZW_Encoding
+        return LZW_Encoding.encode_stream, LZW_Encoding.decode_stream
+    if codec == 'arithmetic':
+        import Arithematic_Encoding
+        AE = Arithematic_Encoding.AdaptiveArithmeticEncoding()
+        return AE.encode_stream, AE.decode_stream
+    if codec == 'lzss':
+        import LZSS_Encoding
+        return LZSS_Encoding.encode_stream, LZSS_Encoding.decode_stream
+    if codec == 'bwt':
+        import BWT_Encoding
+        return BWT_Encoding.encode_stream, BWT_Encoding.decode_stream
+    raise ValueError("unknown codec: {}".format(codec))
+
+def encode(codec, input_file, output_file, block_size=BLOCK_SIZE, checksum=None):
+    '''
+        Encodes a binary file object into another one, holding at most a few blocks in memory
+
+        Parameters:
+            codec: 'huffman', 'lzw', 'arithmetic', 'lzss' or 'bwt'
+            input_file: file object to read the data from
+            output_file: file object to write the encoded data to
+            block_size: number of bytes read at once
+            checksum: optional StreamChecksum updated with the data read
+
+        Return:
+            Number of bytes written
+    '''
+    encode_stream, _ = get_codec(codec)
+    blocks = map_blocks(input_file, block_size)
+    if checksum is not None:
+        blocks = checksum.update(blocks)
+    return write_blocks(encode_stream(blocks), output_file, block_size)
+
+def decode(codec, input_file, output_file, block_size=BLOCK_SIZE, checksum=None):
+    '''
+        Decodes a binary file object into another one, holding at most a few blocks in memory
+
+        Parameters:
+            codec: 'huffman', 'lzw', 'arithmetic', 'lzss' or 'bwt'
+            input_file: file object to read the encoded data from
+            output_file: file object to write the decoded data to
+            block_size: number of bytes read at once
+            checksum: optional StreamChecksum updated with the decoded data
+
+        Return:
+            Number of bytes written
+    '''
+    _, decode_stream = get_codec(codec)
+    blocks = decode_stream(map_blocks(input_file, block_size))
+    if checksum is not None:
+        blocks = checksum.update(blocks)
+    return write_blocks(blocks, output_file, block_size)